@@ -0,0 +1,75 @@
+import click
+import random
+import string
+import time
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from dko_api.lookup import Leaderboard, parse_leaderboard, ones, twos  # noqa: E402
+
+# The kind of mistakes tesseract makes on name boxes
+ocr_confusions = {"l": "1", "I": "l", "O": "0", "o": "0", "S": "5", "B": "8"}
+
+
+def random_name(rng: random.Random) -> str:
+    alphabet = string.ascii_letters + string.digits + "_"
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(4, 16)))
+
+
+def corrupt(name: str, rng: random.Random) -> str:
+    chars = [ocr_confusions.get(c, c) if rng.random() < 0.3 else c for c in name]
+    if len(chars) > 5 and rng.random() < 0.5:
+        del chars[rng.randrange(len(chars))]
+    return "".join(chars)
+
+
+def synthetic_rows(count: int, rng: random.Random):
+    rows = []
+    for i in range(count):
+        rows.append(
+            {
+                "player_name": random_name(rng),
+                "ranking": i // 2 + 1,
+                "match_queue_id": ones if i % 2 == 0 else twos,
+                "god_1": "donkey kong",
+                "god_2": None,
+                "god_3": "null",
+            }
+        )
+    return rows
+
+
+@click.command()
+@click.option("--rows", default=20000, help="Synthetic leaderboard size.")
+@click.option("--queries", default=2000, help="Number of corrupted names to look up.")
+@click.option("--cutoff", default=0.75, help="Fuzzy similarity cutoff.")
+@click.option("--seed", default=0)
+def run(rows, queries, cutoff, seed):
+    rng = random.Random(seed)
+    data = synthetic_rows(rows, rng)
+
+    started = time.perf_counter()
+    leaderboard = Leaderboard(parse_leaderboard(data))
+    print(f"Built index over {rows} rows in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    samples = rng.sample(data, queries)
+    timings = []
+    found = 0
+    for sample in samples:
+        query = corrupt(sample["player_name"], rng)
+        started = time.perf_counter()
+        matches = leaderboard.lookup(query, fuzzy_cutoff=cutoff)
+        timings.append(time.perf_counter() - started)
+        if any(match["name"] == sample["player_name"] for match in matches):
+            found += 1
+
+    timings.sort()
+    print(f"Recovered {found}/{queries} corrupted names at cutoff {cutoff}")
+    print(f"  mean: {sum(timings) / len(timings) * 1000:.3f} ms")
+    print(f"  p50:  {timings[len(timings) // 2] * 1000:.3f} ms")
+    print(f"  p99:  {timings[int(len(timings) * 0.99)] * 1000:.3f} ms")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,110 @@
+import click
+import json
+import time
+from pathlib import Path
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import main  # noqa: E402
+from dko_api.cache import LeaderboardCache  # noqa: E402
+from dko_api.lookup import Leaderboard  # noqa: E402
+from ocr import engine  # noqa: E402
+from ocr.frame import DirectorySource, SourceExhausted, set_frame_source  # noqa: E402
+from ocr.scheduler import ScreenScheduler  # noqa: E402
+from ocr.utils import queues  # noqa: E402
+from perf import timing  # noqa: E402
+from tracker.matches import MatchHistory  # noqa: E402
+
+
+def load_expected(frames: Path, expected: str | None) -> dict:
+    """Expected results per frame name, e.g.
+
+    {"0042.png": {"screen": "character_select", "opponents": ["Name1", "Name2"]}}
+    """
+    path = Path(expected) if expected is not None else frames / "expected.json"
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+@click.command()
+@click.argument("frames", type=click.Path(exists=True))
+@click.option(
+    "--queue",
+    type=click.Choice(["1v1", "2v2", "3v3"], case_sensitive=True),
+    help="Queue the recording was taken in. Detected from the frames if not given.",
+)
+@click.option("--expected", help="JSON file of expected screens/opponents per frame.")
+@click.option("--tesseract-cmd", default="tesseract")
+@click.option(
+    "--ocr-backend",
+    default="auto",
+    type=click.Choice(["auto", "tesserocr", "pytesseract"], case_sensitive=True),
+)
+@click.option("--leaderboard-cache", default="leaderboard_cache.json.gz")
+@click.option("--fuzzy-cutoff", default=0.75)
+def run(
+    frames, queue, expected, tesseract_cmd, ocr_backend, leaderboard_cache, fuzzy_cutoff
+):
+    """Replay a recorded session and report per-stage latency and detection accuracy"""
+    timing.enable()
+    engine.configure(tesseract_cmd, ocr_backend)
+    try:
+        source = main.open_frame_source(frames)
+    except RuntimeError as err:
+        raise click.BadParameter(str(err), param_hint="FRAMES")
+    set_frame_source(source)
+    main.load_screens()
+    expectations = load_expected(Path(frames), expected) if Path(frames).is_dir() else {}
+
+    # Only the cached leaderboard is used, the replay never touches the network
+    leaders = Leaderboard(cache=LeaderboardCache(leaderboard_cache), wait=False)
+    leaders.load_cached()
+    history = MatchHistory(":memory:")
+    scheduler = ScreenScheduler("start")
+    watcher = main.MatchWatcher(
+        scheduler,
+        leaders,
+        history,
+        queues.get(queue),
+        fuzzy_cutoff,
+        interactive=False,
+    )
+
+    screens_checked = screens_correct = names_checked = names_correct = 0
+    started = time.perf_counter()
+    while True:
+        try:
+            scheduler.tick()
+        except SourceExhausted:
+            break
+        if isinstance(source, DirectorySource):
+            name = source.current_path.name
+        else:
+            name = str(source.index)
+        frame_expected = expectations.get(name, {})
+        if "screen" in frame_expected:
+            screens_checked += 1
+            if scheduler.state == frame_expected["screen"]:
+                screens_correct += 1
+            else:
+                print(f"{name}: expected {frame_expected['screen']}, got {scheduler.state}")
+        if "opponents" in frame_expected:
+            names_checked += 1
+            if watcher.opponents == frame_expected["opponents"]:
+                names_correct += 1
+            else:
+                print(f"{name}: expected {frame_expected['opponents']}, got {watcher.opponents}")
+    elapsed = time.perf_counter() - started
+
+    print(f"Replayed {source.index + 1} frames in {elapsed:.2f} s")
+    print(timing.format_summary())
+    if screens_checked > 0:
+        print(f"Screen accuracy: {screens_correct}/{screens_checked}")
+    if names_checked > 0:
+        print(f"Opponent name accuracy: {names_correct}/{names_checked}")
+
+
+if __name__ == "__main__":
+    run()
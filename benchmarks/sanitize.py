@@ -0,0 +1,43 @@
+import click
+import timeit
+from pathlib import Path
+from PIL import Image, ImageChops
+import numpy as np
+import sys
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ocr.utils import sanitize_image, sanitize_image_loop  # noqa: E402
+
+
+@click.command()
+@click.option(
+    "--media-dir",
+    default=str(Path(__file__).resolve().parent.parent / "test_media"),
+    help="Directory of sample images to benchmark against.",
+)
+@click.option("--number", default=20, help="Iterations per implementation.")
+def run(media_dir, number):
+    images = sorted(Path(media_dir).glob("*.png"))
+    if len(images) == 0:
+        print(f"No images found in {media_dir}")
+        return
+    for path in images:
+        image = Image.open(path).convert("RGB")
+        loop_result = ImageChops.invert(sanitize_image_loop(image)).convert("L")
+        vector_result = sanitize_image(image, invert=True)
+        same = np.array_equal(np.asarray(loop_result), np.asarray(vector_result))
+
+        loop_time = timeit.timeit(
+            lambda: ImageChops.invert(sanitize_image_loop(image)), number=number
+        )
+        vector_time = timeit.timeit(
+            lambda: sanitize_image(image, invert=True), number=number
+        )
+        print(f"{path.name} ({image.width}x{image.height}) identical output: {same}")
+        print(f"  loop:       {loop_time / number * 1000:8.3f} ms")
+        print(f"  vectorized: {vector_time / number * 1000:8.3f} ms")
+        print(f"  speedup:    {loop_time / vector_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,55 @@
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Tuple
+
+
+@dataclass(frozen=True, slots=True)
+class LeaderboardEntry:
+    name: str
+    rank: int
+    gods: Tuple[str, ...]
+
+
+class GodNames(object):
+    """Interns god names and god combinations, so every row with the same picks shares one tuple"""
+
+    __slots__ = ("combos",)
+
+    def __init__(self):
+        self.combos: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+    def intern(self, raw_gods) -> Tuple[str, ...]:
+        gods = tuple(
+            sys.intern(god.title()) for god in raw_gods if god is not None and god != "null"
+        )
+        return self.combos.setdefault(gods, gods)
+
+
+class QueueBoard(object):
+    """One queue's leaderboard as parallel columns sorted by rank
+
+    Rows are only materialized as LeaderboardEntry objects when read, so a large
+    leaderboard costs a few lists and an int array rather than a dict per player.
+    """
+
+    __slots__ = ("ranks", "names", "gods")
+
+    def __init__(self, rows: List[Tuple[int, str, Tuple[str, ...]]] = ()):
+        rows = sorted(rows, key=lambda row: row[0])
+        self.ranks = array("i", [row[0] for row in rows])
+        self.names: List[str] = [row[1] for row in rows]
+        self.gods: List[Tuple[str, ...]] = [row[2] for row in rows]
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, row: int) -> LeaderboardEntry:
+        return LeaderboardEntry(self.names[row], self.ranks[row], self.gods[row])
+
+    def __iter__(self) -> Iterator[LeaderboardEntry]:
+        for row in range(len(self.names)):
+            yield LeaderboardEntry(self.names[row], self.ranks[row], self.gods[row])
+
+    def as_dict(self, row: int) -> dict:
+        return {"name": self.names[row], "rank": self.ranks[row], "gods": list(self.gods[row])}
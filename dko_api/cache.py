@@ -0,0 +1,107 @@
+import gzip
+import json
+import os
+import time
+from pathlib import Path
+from typing import List
+
+leaderboard_url = "https://api2.hirezstudios.com/stats/leaderboard"
+# Only the columns parse_leaderboard uses are persisted
+cache_fields = ["player_name", "ranking", "match_queue_id", "god_1", "god_2", "god_3"]
+
+
+class LeaderboardCache(object):
+    """Raw leaderboard rows persisted to a gzipped JSON file, refreshed with conditional GETs"""
+
+    def __init__(
+        self,
+        path="leaderboard_cache.json.gz",
+        url: str = leaderboard_url,
+        ttl: float = 900,
+        timeout: float = 10,
+    ):
+        self.path = Path(path)
+        self.url = url
+        self.ttl = ttl
+        self.timeout = timeout
+        self.rows: List[dict] | None = None
+        self.etag: str | None = None
+        self.last_modified: str | None = None
+        self.fetched_at = 0.0
+        self._session = None
+
+    @property
+    def session(self):
+        """Pooled connection, reused across refreshes. requests is only imported once it's needed."""
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+        return self._session
+
+    def load(self) -> List[dict] | None:
+        """Read the cached rows from disk, returning None if there is no usable cache"""
+        if not self.path.exists():
+            return None
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                data = json.load(f)
+            fields = data["fields"]
+            rows = [dict(zip(fields, row)) for row in data["rows"]]
+        except (OSError, ValueError, KeyError, TypeError) as err:
+            print(f"Ignoring unreadable leaderboard cache {self.path}: {err!r}")
+            return None
+        self.rows = rows
+        self.etag = data.get("etag")
+        self.last_modified = data.get("last_modified")
+        self.fetched_at = data.get("fetched_at", 0.0)
+        return self.rows
+
+    def save(self):
+        data = {
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "fetched_at": self.fetched_at,
+            "fields": cache_fields,
+            "rows": [[row.get(field) for field in cache_fields] for row in self.rows or []],
+        }
+        # Write then rename so a crash never leaves a truncated cache behind
+        temp_path = self.path.with_name(self.path.name + ".tmp")
+        with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(temp_path, self.path)
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def is_stale(self) -> bool:
+        return self.rows is None or self.age() >= self.ttl
+
+    def fetch(self) -> bool:
+        """Fetch the leaderboard if it changed on the server, returning True when rows were replaced"""
+        headers = {}
+        if self.rows is not None:
+            if self.etag is not None:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified is not None:
+                headers["If-Modified-Since"] = self.last_modified
+        r = self.session.get(self.url, headers=headers, timeout=self.timeout)
+        changed = False
+        if r.status_code == 304:
+            pass
+        else:
+            r.raise_for_status()
+            rows = r.json().get("rows")
+            if not isinstance(rows, list):
+                raise ValueError("leaderboard response has no rows")
+            self.rows = [{field: row.get(field) for field in cache_fields} for row in rows]
+            self.etag = r.headers.get("ETag")
+            self.last_modified = r.headers.get("Last-Modified")
+            changed = True
+        self.fetched_at = time.time()
+        # The fetched rows are still good when the disk isn't, they just won't survive a restart
+        try:
+            self.save()
+        except OSError as err:
+            print(f"Failed to save leaderboard cache {self.path}: {err}")
+        return changed
@@ -0,0 +1,83 @@
+import heapq
+from collections import defaultdict
+from typing import Iterable, List, Tuple
+
+ngram_size = 3
+
+
+def ngrams(key: str) -> set:
+    """Character trigrams of a key, padded by one space so name edges still produce grams"""
+    padded = f" {key} "
+    return {padded[i : i + ngram_size] for i in range(len(padded) - ngram_size + 1)}
+
+
+def levenshtein(a: str, b: str, max_distance: int | None = None) -> int:
+    """Edit distance between two strings, giving up early once max_distance is exceeded"""
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (ca != cb),
+                )
+            )
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def similarity(a: str, b: str, max_distance: int | None = None) -> float:
+    longest = max(len(a), len(b))
+    if longest == 0:
+        return 1.0
+    return 1 - levenshtein(a, b, max_distance) / longest
+
+
+class NameIndex(object):
+    """Trigram inverted index over normalized names.
+
+    Candidates are gathered from names sharing trigrams with the query, and edit
+    distance is only computed for the few best of those, never the whole leaderboard.
+    """
+
+    def __init__(self, keys: Iterable[str], candidate_limit: int = 10):
+        self.keys = list(keys)
+        self.candidate_limit = candidate_limit
+        self.postings = defaultdict(list)
+        for key_id, key in enumerate(self.keys):
+            for gram in ngrams(key):
+                self.postings[gram].append(key_id)
+
+    def search(self, key: str, cutoff: float = 0.75, limit: int = 5) -> List[Tuple[float, str]]:
+        """Return up to limit (score, key) pairs with similarity >= cutoff, best first"""
+        if len(key) == 0:
+            return []
+        grams = ngrams(key)
+        shared = defaultdict(int)
+        for gram in grams:
+            for key_id in self.postings.get(gram, ()):
+                shared[key_id] += 1
+        candidates = heapq.nlargest(self.candidate_limit, shared, key=shared.__getitem__)
+        results = []
+        for key_id in candidates:
+            candidate = self.keys[key_id]
+            # Largest edit distance that can still reach the cutoff
+            max_distance = int((1 - cutoff) * max(len(key), len(candidate)))
+            if abs(len(key) - len(candidate)) > max_distance:
+                continue
+            # Each edit destroys at most ngram_size grams (q-gram lemma)
+            if shared[key_id] < len(grams) - ngram_size * max_distance:
+                continue
+            score = similarity(key, candidate, max_distance)
+            if score >= cutoff:
+                results.append((score, candidate))
+        results.sort(key=lambda result: result[0], reverse=True)
+        return results[:limit]
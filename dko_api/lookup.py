@@ -1,7 +1,13 @@
-import requests
+import sqlite3
+import threading
+import time
 from pprint import pprint as pp
-from sortedcontainers import SortedList
-from typing import TypedDict, List
+from typing import NamedTuple, TypedDict, List, Dict
+from perf.timing import timed
+from .board import GodNames, QueueBoard
+from .fuzzy import NameIndex
+from .names import normalize_name
+from .cache import LeaderboardCache, leaderboard_url
 
 
 queues = [{"id": 469, "name": "2v2 brawl"}, {"id": 511, "name": "1v1 duel"}]
@@ -10,6 +16,16 @@ twos = 469
 ones = 511
 
 
+def build_name_index(leaderboard: Dict[str, QueueBoard]) -> Dict[str, Dict[str, List[int]]]:
+    """Map normalized player names to their rows in each queue"""
+    index = {}
+    for queue_name, board in leaderboard.items():
+        for row, name in enumerate(board.names):
+            queues_for_name = index.setdefault(normalize_name(name), {})
+            queues_for_name.setdefault(queue_name, []).append(row)
+    return index
+
+
 class Player(TypedDict):
     Rank: int
     Name: str
@@ -17,50 +33,193 @@ class Player(TypedDict):
     Queue: str
 
 
+def parse_leaderboard(rows: List[dict]) -> Dict[str, QueueBoard]:
+    """Group raw leaderboard API rows by queue into columnar boards sorted by rank"""
+    queue_names = {queue["id"]: queue["name"] for queue in queues}
+    grouped = {queue["name"]: [] for queue in queues}
+    god_names = GodNames()
+    for row in rows:
+        queue_name = queue_names.get(row["match_queue_id"])
+        if queue_name is None:
+            continue
+        gods = god_names.intern(row[god] for god in god_keys)
+        grouped[queue_name].append((row["ranking"], row["player_name"], gods))
+    return {queue_name: QueueBoard(entries) for queue_name, entries in grouped.items()}
+
+
+class Snapshot(NamedTuple):
+    leaders: Dict[str, QueueBoard]
+    index: Dict[str, Dict[str, List[int]]]
+    fuzzy_index: NameIndex
+    fetched_at: float | None
+
+
 class Leaderboard:
-    def __init__(self):
-        self.leaders = self.get_leaderboard()
+    def __init__(
+        self,
+        leaders: Dict[str, QueueBoard] | None = None,
+        cache: LeaderboardCache | None = None,
+        wait: bool = True,
+        history=None,
+    ):
+        """Load the leaderboard from leaders, the cache or the network.
+
+        With wait=False, start out empty and leave reading the cache and the first
+        fetch to the background refresh thread instead of blocking here. If a
+        tracker.snapshots.LeaderboardHistory is given, every new set of leaders is recorded in it.
+        """
+        self.cache = cache
+        self.history = history
+        self._session = None
+        self._stop_refresh = threading.Event()
+        self._refresh_thread = None
+        if leaders is not None:
+            self.set_leaders(leaders)
+        elif not wait and cache is not None:
+            empty = parse_leaderboard([])
+            self.snapshot = Snapshot(empty, {}, NameIndex([]), None)
+        elif not self.load_cached():
+            self.set_leaders(self.get_leaderboard())
+
+    @property
+    def session(self):
+        if self.cache is not None:
+            return self.cache.session
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+        return self._session
+
+    @property
+    def leaders(self) -> Dict[str, QueueBoard]:
+        return self.snapshot.leaders
+
+    @property
+    def index(self) -> Dict[str, Dict[str, List[int]]]:
+        return self.snapshot.index
+
+    @property
+    def ready(self) -> bool:
+        return self.snapshot.fetched_at is not None
+
+    def age(self) -> float | None:
+        """Seconds since the current data was fetched or confirmed unchanged, None if never loaded"""
+        fetched_at = self.snapshot.fetched_at
+        if fetched_at is None:
+            return None
+        return time.time() - fetched_at
+
+    def set_leaders(self, leaders: Dict[str, QueueBoard], fetched_at: float | None = None):
+        if fetched_at is None:
+            fetched_at = time.time()
+        index = build_name_index(leaders)
+        # Swapped in a single assignment so lookups never see a half-built index
+        self.snapshot = Snapshot(leaders, index, NameIndex(index.keys()), fetched_at)
+        if self.history is not None:
+            try:
+                self.history.record(leaders, fetched_at)
+            except sqlite3.Error as err:
+                print(f"Failed to record leaderboard snapshot: {err}")
+
+    def load_cached(self) -> bool:
+        """Swap in the leaderboard cached on disk, returning False if there is none"""
+        if self.cache is None or self.cache.load() is None:
+            return False
+        self.set_leaders(parse_leaderboard(self.cache.rows), self.cache.fetched_at)
+        return True
 
     def get_leaderboard(self):
-        r = requests.get("https://api2.hirezstudios.com/stats/leaderboard")
-        results = r.json()
-        leaders = results["rows"]
-        _temp_lb = {
-            "1v1 duel": [
-                player for player in leaders if player["match_queue_id"] == ones
-            ],
-            "2v2 brawl": [
-                player for player in leaders if player["match_queue_id"] == twos
-            ],
-        }
-        leaderboard = {}
-        for queue in queues:
-            ranks = SortedList(key=lambda x: x["rank"])
-            entries = []
-            for entry in _temp_lb[queue["name"]]:
-                gods = []
-                for god in god_keys:
-                    if entry[god] != "null" and entry[god] != None:
-                        gods.append(entry[god].title())
-                entries.append(
-                    {
-                        "name": entry["player_name"],
-                        "rank": entry["ranking"],
-                        "gods": gods,
-                    }
-                )
-            ranks.update(entries)
-            leaderboard[queue["name"]] = ranks
-        return leaderboard
-
-    def lookup(self, player_name: str) -> List[dict]:
+        if self.cache is None:
+            r = self.session.get(leaderboard_url)
+            results = r.json()
+            return parse_leaderboard(results["rows"])
+        self.cache.fetch()
+        return parse_leaderboard(self.cache.rows)
+
+    def refresh(self) -> bool:
+        """Refresh from the server through the cache, swapping in new data if it changed"""
+        if self.cache.fetch():
+            self.set_leaders(parse_leaderboard(self.cache.rows), self.cache.fetched_at)
+            return True
+        self.snapshot = self.snapshot._replace(fetched_at=self.cache.fetched_at)
+        return False
+
+    def _refresh_loop(self):
+        # Anything going wrong is logged and retried, the thread must outlive a bad response or a full disk
+        if not self.ready:
+            try:
+                self.load_cached()
+            except Exception as err:
+                print(f"Loading the cached leaderboard failed: {err!r}")
+        while not self._stop_refresh.is_set():
+            if self.cache.is_stale():
+                try:
+                    self.refresh()
+                except Exception as err:
+                    print(f"Leaderboard refresh failed: {err}")
+                    self._stop_refresh.wait(60)
+                    continue
+            self._stop_refresh.wait(max(self.cache.ttl - self.cache.age(), 1))
+
+    def start_refresh(self):
+        """Keep the leaderboard fresh on a daemon thread, refreshing whenever the cache TTL expires"""
+        if self.cache is None or self._refresh_thread is not None:
+            return
+        self._stop_refresh.clear()
+        self._refresh_thread = threading.Thread(
+            target=self._refresh_loop, name="leaderboard-refresh", daemon=True
+        )
+        self._refresh_thread.start()
+
+    def stop_refresh(self):
+        self._stop_refresh.set()
+        if self._refresh_thread is not None:
+            self._refresh_thread.join()
+            self._refresh_thread = None
+
+    def lookup(self, player_name: str, fuzzy_cutoff: float | None = None) -> List[dict]:
+        """Find a player's entry in each queue.
+
+        If there's no match on the normalized name and fuzzy_cutoff is given, the best
+        fuzzy candidate scoring at least fuzzy_cutoff is used instead.
+        """
+        with timed("lookup"):
+            return self._lookup(player_name, fuzzy_cutoff)
+
+    def _lookup(self, player_name: str, fuzzy_cutoff: float | None) -> List[dict]:
         matches = []
+        snapshot = self.snapshot
+        key = normalize_name(player_name)
+        by_queue = snapshot.index.get(key)
+        if by_queue is None and fuzzy_cutoff is not None:
+            candidates = snapshot.fuzzy_index.search(key, fuzzy_cutoff, limit=1)
+            if len(candidates) > 0:
+                by_queue = snapshot.index[candidates[0][1]]
+        if by_queue is None:
+            return matches
         for queue in queues:
-            lb = self.leaders[queue["name"]]
-            for entry in lb:
-                if entry["name"] == player_name:
-                    entry["queue"] = queue["name"]
-                    matches.append(entry)
-                    break
+            rows = by_queue.get(queue["name"])
+            if not rows:
+                continue
+            board = snapshot.leaders[queue["name"]]
+            # Prefer an exact match when several names normalize to the same key
+            row = next((r for r in rows if board.names[r] == player_name), rows[0])
+            matches.append({**board.as_dict(row), "queue": queue["name"]})
 
         return matches
+
+    def fuzzy_lookup(
+        self, player_name: str, cutoff: float = 0.75, limit: int = 5
+    ) -> List[dict]:
+        """Return leaderboard entries whose names resemble player_name, best score first"""
+        matches = []
+        snapshot = self.snapshot
+        for score, key in snapshot.fuzzy_index.search(
+            normalize_name(player_name), cutoff, limit
+        ):
+            for queue in queues:
+                board = snapshot.leaders[queue["name"]]
+                for row in snapshot.index[key].get(queue["name"], []):
+                    matches.append({**board.as_dict(row), "queue": queue["name"], "score": score})
+        return matches
@@ -0,0 +1,9 @@
+# Characters OCR commonly confuses, collapsed onto a single representative
+confusables = str.maketrans(
+    {"0": "o", "1": "l", "i": "l", "|": "l", "!": "l", "5": "s", "8": "b"}
+)
+
+
+def normalize_name(name: str) -> str:
+    """Casefold a player name and collapse whitespace and OCR-confusable characters"""
+    return "".join(name.casefold().split()).translate(confusables)
@@ -1,19 +1,36 @@
+import time
+
+# Taken before the other imports so --startup-profile can report them
+started = time.perf_counter()
+
 import click
-import pytesseract
 from dko_api import lookup
-from ocr import ocr, utils, screen
-import time
-from typing import TypedDict, List
+from dko_api.cache import LeaderboardCache
+from ocr import ocr, utils, screen, engine, debug_images
+from ocr.frame import Frame, DirectorySource, VideoSource, SourceExhausted
+from ocr.frame import set_frame_source, get_frame_source, open_screen_source
+from pathlib import Path
+from ocr.scheduler import ScreenScheduler, Transition
+from typing import TypedDict, List, Tuple
 from ocr.utils import queues
+from perf import timing
+from perf.profiling import TickProfiler
+from perf.startup import StartupProfile
 from tracker.matches import MatchHistory
+from tracker.snapshots import LeaderboardHistory
+
+imported = time.perf_counter()
 
 debug_mode = False
-SCREENS = screen.get_screens()
+# Built by load_screens once the resolution and queue are known
+SCREENS = {}
+screen_resolution: Tuple[int, int] | None = None
 
 
 class QueueDetection(TypedDict):
     Name: str
     Valid: bool
+    Text: str
 
 
 class Opponents(TypedDict):
@@ -21,31 +38,17 @@ class Opponents(TypedDict):
     Valid: bool
 
 
-def detect_queue() -> QueueDetection:
-    result = QueueDetection(Name="", Valid=False)
+def detect_queue(frame: Frame) -> QueueDetection:
+    result = QueueDetection(Name="", Valid=False, Text="")
     queue_detect_box = SCREENS["queue_detection"]
     valid_queues = queue_detect_box["valid_queues"]
-    detected = False
-    while not detected:
-        found = ocr.detect_screen(queue_detect_box, debug=debug_mode)
-        if found:
-            print("Queue detected")
-            detected = True
-            break
-        if debug_mode:
-            print("Queue not detected")
-            time.sleep(2)
-        else:
-            time.sleep(0.5)
-
     process_results = ocr.process_locations(
-        queue_detect_box["locations"], text_to_lower=True
+        queue_detect_box["locations"], text_to_lower=True, frame=frame
     )
     if len(process_results) == 0:
-        print("No queue text detected")
         return result
     queue_text = process_results[0]
-    print(f"Found queue text: {queue_text}")
+    result["Text"] = queue_text
     for queue in valid_queues:
         filtered = ocr.filter_characters(queue_text, queue["name"])
         if ocr.contains_characters(filtered, queue["must_contain"]):
@@ -57,38 +60,36 @@ def detect_queue() -> QueueDetection:
     return result
 
 
-def detect_opponent_names(box: dict, queue: str):
-    while ocr.detect_screen(box):
-        results = ocr.process_locations(
-            SCREENS["character_selection"][queue]["locations"],
-            text_to_lower=False,
-            debug=debug_mode,
-        )
-        if len(results) > 0:
-            return results
-        time.sleep(3)
-    return None
-
+def detect_opponent_names(box: dict, frame: Frame) -> List[str | None]:
+    return ocr.process_locations(
+        box["locations"],
+        text_to_lower=False,
+        debug=debug_mode,
+        frame=frame,
+        concurrent=True,
+        deadline=2,
+    )
 
-def detect_match_results(queue: str):
-    while not ocr.detect_screen(
-        SCREENS["match_results"][queue], debug=debug_mode, test_threshold=2
-    ):
-        time.sleep(3)
 
+def detect_match_results(box: dict, frame: Frame) -> List[str]:
     results = ocr.process_locations(
-        SCREENS["match_results"][queue]["locations"],
+        box["locations"],
         text_to_lower=True,
-        config="--psm 7",
         debug=debug_mode,
+        frame=frame,
     )
     if debug_mode:
         print(f"[detect_match_results]: {results}")
     return results
 
 
-def save_match_results(db: MatchHistory, opponents: List[str], game_mode: str):
-    results = detect_match_results(game_mode)
+def save_match_results(
+    db: MatchHistory,
+    opponents: List[str],
+    game_mode: str,
+    results: List[str],
+    interactive=True,
+):
     result = None
     if len(results) > 0:
         if results[0] == "defeat":
@@ -97,6 +98,9 @@ def save_match_results(db: MatchHistory, opponents: List[str], game_mode: str):
             result = 1
     if result is None:
         click.echo("No match results detected")
+        debug_images.flush_ring("no-match-results")
+        if not interactive:
+            return
         res = click.prompt("Did you win or lose? (y/n)", type=click.Choice(["y", "n"]))
         result = 1 if res == "y" else 0
     db.add_result(game_mode, result, *opponents)
@@ -111,8 +115,198 @@ def print_last_5_matches(db: MatchHistory, game_mode: str):
     if len(last_5_matches) > 0:
         click.echo("\nLast 5 Matches")
         click.echo(db.history_to_table(last_5_matches))
-        summary = db.get_win_loss(game_mode=game_mode)
-        click.echo(f"Total Wins: {summary['wins']} Losses: {summary['losses']}")
+        stats = db.get_stats(game_mode)
+        click.echo(f"Total Wins: {stats['wins']} Losses: {stats['losses']}")
+        streak = stats["streak"]
+        streak_text = f"{abs(streak)} {'win' if streak > 0 else 'loss'}"
+        click.echo(
+            f"Current streak: {streak_text} | Last {stats['recent_count']} win rate: {stats['recent_win_rate']:.0%}"
+        )
+
+
+def print_leaderboard_alert(
+    leaders: lookup.Leaderboard, opponents: List[str], fuzzy_cutoff: float
+):
+    matches = []
+    for opponent in opponents:
+        leaderboard_entries = leaders.lookup(opponent, fuzzy_cutoff=fuzzy_cutoff)
+        if len(leaderboard_entries) > 0:
+            matches.extend(leaderboard_entries)
+
+    leaderboard_age = leaders.age()
+    if leaderboard_age is None:
+        print("Leaderboard is still loading, results may be incomplete")
+    if len(matches) == 0:
+        print(f"Not found on the leaderboard: {', '.join(opponents)}, have fun!")
+    else:
+        body = []
+        for match in matches:
+            body.append(
+                f"Player: {match['name']} | Queue: {match['queue']} | Rank: {match['rank']} | Gods: {', '.join(match['gods'])}"
+            )
+        if leaderboard_age is not None:
+            body.append(f"(leaderboard data {int(leaderboard_age // 60)} min old)")
+
+        utils.print_surrounded("Leaderboard Alert", "\n".join(body))
+
+
+def print_head_to_head(db: MatchHistory, opponents: List[str], game_mode: str):
+    records = db.head_to_head(opponents, game_mode)
+    if len(records) == 0:
+        return
+    body = []
+    for record in records.values():
+        line = f"Player: {record['opponent']} | Wins: {record['wins']} | Losses: {record['losses']}"
+        stats = None if game_mode is None else db.get_opponent_stats(game_mode, record["opponent"])
+        if stats is not None:
+            line += (
+                f" | Streak: {stats['streak']:+d}"
+                f" | Last {stats['recent_count']}: {stats['recent_win_rate']:.0%}"
+            )
+        body.append(f"{line} | Last played: {record['last_played']}")
+    utils.print_surrounded("Head to Head", "\n".join(body))
+
+
+def load_screens(
+    resolution: Tuple[int, int] | None = None, game_mode: str | None = None
+):
+    """Scale the screen definitions to the given resolution, detecting it from the frame source if not given
+
+    Per-queue screens are only built for game_mode, other queues are built by
+    queue_screens once queue detection picks them.
+    """
+    global SCREENS, screen_resolution
+    if resolution is None:
+        resolution = get_frame_source().resolution()
+    print(f"Using screen layout for {resolution[0]}x{resolution[1]}")
+    screen_resolution = tuple(resolution)
+    game_modes = (game_mode,) if game_mode is not None else ()
+    SCREENS = screen.get_screens(resolution=screen_resolution, queues=game_modes)
+
+
+def queue_screens(game_mode: str) -> dict:
+    if game_mode in SCREENS["character_selection"]:
+        return SCREENS
+    return screen.get_screens(resolution=screen_resolution, queues=(game_mode,))
+
+
+def open_frame_source(path: str):
+    if Path(path).is_dir():
+        return DirectorySource(path)
+    return VideoSource(path)
+
+
+class MatchWatcher(object):
+    """Handlers for the screen scheduler, following one game from queue to results"""
+
+    def __init__(
+        self,
+        scheduler: ScreenScheduler,
+        leaders: lookup.Leaderboard,
+        match_history: MatchHistory,
+        game_mode: str | None,
+        fuzzy_cutoff: float,
+        interactive=True,
+    ):
+        self.scheduler = scheduler
+        self.leaders = leaders
+        self.match_history = match_history
+        self.fixed_mode = game_mode is not None
+        self.game_mode = None
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.interactive = interactive
+        self.opponents: List[str] | None = None
+        self.queue_valid = False
+        self.queue_text: str | None = None
+
+        scheduler.set_screen("home", SCREENS["queue_detection"])
+        scheduler.on_enter("home", self.enter_home)
+        scheduler.on_tick("home", self.tick_home)
+        scheduler.on_enter("character_select", self.enter_character_select)
+        scheduler.on_tick("character_select", self.tick_character_select)
+        scheduler.on_enter("match_results", self.enter_match_results)
+        scheduler.expect("start", "home")
+        scheduler.expect("home", "character_select")
+        scheduler.expect("character_select", "match_results")
+        scheduler.expect("match_results", "home")
+        if game_mode is not None:
+            self.set_game_mode(game_mode)
+
+    def set_game_mode(self, game_mode: str):
+        if game_mode != self.game_mode:
+            self.game_mode = game_mode
+            screens = queue_screens(game_mode)
+            self.scheduler.set_screen(
+                "character_select", screens["character_selection"].get(game_mode)
+            )
+            self.scheduler.set_screen(
+                "match_results", screens["match_results"].get(game_mode)
+            )
+        print_last_5_matches(self.match_history, game_mode)
+
+    def enter_home(self, transition: Transition):
+        print("Queue detected")
+        self.queue_valid = self.fixed_mode
+        self.queue_text = None
+        self.tick_home(transition.frame)
+
+    def tick_home(self, frame: Frame):
+        if self.queue_valid:
+            return
+        queue_detection = detect_queue(frame)
+        # The home screen is polled every tick, only report text that changed since the last one
+        if queue_detection["Text"] == self.queue_text:
+            return
+        self.queue_text = queue_detection["Text"]
+        if self.queue_text == "":
+            print("No queue text detected")
+        else:
+            print(f"Found queue text: {self.queue_text}")
+        if not queue_detection["Valid"]:
+            print(f"Invalid queue name detected {queue_detection['Name']}")
+            debug_images.flush_ring("invalid-queue")
+            return
+        self.queue_valid = True
+        print(
+            f"Valid Queue Name detected: {queue_detection['Name']}, waiting for match to start..."
+        )
+        self.set_game_mode(queue_detection["Name"])
+
+    def enter_character_select(self, transition: Transition):
+        print("Found character selection screen, looking for opponent names...")
+        self.opponents = None
+        self.tick_character_select(transition.frame)
+
+    def tick_character_select(self, frame: Frame):
+        if self.opponents is not None:
+            return
+        opponents = detect_opponent_names(self.scheduler.screens["character_select"], frame)
+        # Locations that missed the deadline are read again on the next tick
+        if len(opponents) == 0 or None in opponents:
+            return
+        self.opponents = opponents
+        print_leaderboard_alert(self.leaders, opponents, self.fuzzy_cutoff)
+        print_head_to_head(self.match_history, opponents, self.game_mode)
+        print("Good luck! Waiting for match results...")
+
+    def enter_match_results(self, transition: Transition):
+        if self.opponents is None or len(self.opponents) == 0:
+            print("No opponents were able to be detected, restarting detection...")
+            debug_images.flush_ring("no-opponents")
+            return
+        results = detect_match_results(
+            self.scheduler.screens["match_results"], transition.frame
+        )
+        save_match_results(
+            self.match_history,
+            self.opponents,
+            self.game_mode,
+            results,
+            self.interactive,
+        )
+        self.opponents = None
+        if self.fixed_mode:
+            print_last_5_matches(self.match_history, self.game_mode)
 
 
 @click.command()
@@ -127,67 +321,199 @@ def print_last_5_matches(db: MatchHistory, game_mode: str):
     type=click.Choice(["1v1", "2v2", "3v3"], case_sensitive=True),
     help="Name of the queue to look for. Skips queue detection if provided.",
 )
-def run(tesseract_cmd, queue):
-    pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+@click.option(
+    "--ocr-backend",
+    default="auto",
+    type=click.Choice(["auto", "tesserocr", "pytesseract"], case_sensitive=True),
+    help="OCR backend. auto keeps tesseract loaded via tesserocr when installed.",
+)
+@click.option(
+    "--fuzzy-cutoff",
+    default=0.75,
+    type=click.FloatRange(0, 1),
+    help="Minimum similarity for matching OCR'd names to leaderboard names. 1 disables fuzzy matching.",
+)
+@click.option(
+    "--leaderboard-cache",
+    default="leaderboard_cache.json.gz",
+    help="File the leaderboard is cached in between runs.",
+)
+@click.option(
+    "--leaderboard-ttl",
+    default=900,
+    help="Seconds before the cached leaderboard is refreshed in the background.",
+)
+@click.option(
+    "--leaderboard-history",
+    default="leaderboard_history.db",
+    help="Database every leaderboard refresh is recorded in, for rank history.",
+)
+@click.option(
+    "--resolution",
+    type=(int, int),
+    help="Screen resolution as WIDTH HEIGHT. Detected from the screen if not given.",
+)
+@click.option(
+    "--capture-backend",
+    default="auto",
+    type=click.Choice(["auto", "mss", "imagegrab"], case_sensitive=True),
+    help="Screen capture backend. auto uses mss, which captures only the watched regions, when installed.",
+)
+@click.option(
+    "--frames",
+    type=click.Path(exists=True),
+    help="Replay a directory of screenshots or a screen recording instead of capturing the screen.",
+)
+@click.option(
+    "--debug",
+    is_flag=True,
+    help="Print screen transitions and the failed checkpoints of the next expected screen, and save every OCR'd crop to --debug-dir.",
+)
+@click.option("--debug-dir", default="debug", help="Directory debug images are saved in.")
+@click.option(
+    "--debug-ring",
+    default=0,
+    help="Keep only the last N crops in memory and save them when a detection fails.",
+)
+@click.option(
+    "--debug-format",
+    default="png",
+    type=click.Choice(["png", "bmp"], case_sensitive=False),
+    help="Debug image format, bmp is uncompressed and the cheapest to write.",
+)
+@click.option(
+    "--startup-profile",
+    is_flag=True,
+    help="Report how long imports and each startup step took. Use python -X importtime for per-module detail.",
+)
+@click.option(
+    "--perf",
+    is_flag=True,
+    help="Print per-stage latency percentiles and counters when stopping.",
+)
+@click.option("--perf-log", help="Append latency percentiles to this JSON lines file.")
+@click.option(
+    "--perf-log-interval",
+    default=60.0,
+    help="Seconds between --perf-log entries.",
+)
+@click.option(
+    "--profile",
+    "profile_path",
+    help="Profile sampled ticks with cProfile and write the combined stats to this file.",
+)
+@click.option(
+    "--profile-every",
+    default=10,
+    help="Profile one in every N ticks when --profile is given.",
+)
+@click.option(
+    "--profile-slow-ms",
+    type=float,
+    help="Only keep profiled ticks that took at least this many milliseconds.",
+)
+def run(
+    tesseract_cmd,
+    queue,
+    ocr_backend,
+    fuzzy_cutoff,
+    leaderboard_cache,
+    leaderboard_ttl,
+    leaderboard_history,
+    resolution,
+    capture_backend,
+    frames,
+    debug,
+    debug_dir,
+    debug_ring,
+    debug_format,
+    startup_profile,
+    perf,
+    perf_log,
+    perf_log_interval,
+    profile_path,
+    profile_every,
+    profile_slow_ms,
+):
+    global debug_mode
+    startup = StartupProfile(started)
+    startup.step("imports", imported)
+    startup.step("cli")
+    debug_mode = debug
+    if debug or debug_ring > 0:
+        debug_images.configure(debug_dir, ring_size=debug_ring, image_format=debug_format)
+    # Bounded and cheap, so the stage timers are always on
+    timing.enable()
+    log_writer = None
+    if perf_log is not None:
+        log_writer = timing.LogWriter(perf_log, perf_log_interval)
+    ocr_engine = engine.configure(tesseract_cmd, ocr_backend)
+    print(f"Using OCR backend: {ocr_engine.name}")
     print("Starting...")
-    leaders = lookup.Leaderboard()
-    queue_name = queues.get(queue)
-    match_history = MatchHistory("match_history.db")
-
-    if queue_name is None:
-        print("Invalid queue name provided, exiting...")
-        return
-    while True:
-        # Detect queue
-        if queue is None:
-            queue_detection = QueueDetection(Name=queue_name, Valid=True)
-            print("Waiting for queue to start...")
-            queue_detection = detect_queue()
-            while not queue_detection["Valid"]:
-                print(f"Invalid queue name detected {queue_detection['Name']}")
-                time.sleep(5)
-                queue_detection = detect_queue()
-            print(
-                f"Valid Queue Name detected: {queue_detection['Name']}, waiting for match to start..."
-            )
-            print_last_5_matches(match_history, queue_detection["Name"])
-        else:
-            print(
-                f"Skipping queue detection, waiting for {queue} character selection screen..."
-            )
-            queue_detection = QueueDetection(Name=queue_name, Valid=True)
-            print_last_5_matches(match_history, queue_detection["Name"])
+    startup.step("ocr engine")
+    leaders = lookup.Leaderboard(
+        cache=LeaderboardCache(leaderboard_cache, ttl=leaderboard_ttl),
+        wait=False,
+        history=LeaderboardHistory(leaderboard_history),
+    )
+    leaders.start_refresh()
+    startup.step("leaderboard")
+    match_history = MatchHistory("match_history.db", async_writes=True)
+    startup.step("match history")
 
-        char_select_box = SCREENS["character_selection"][queue_detection["Name"]]
-        while not ocr.detect_screen(char_select_box):
-            time.sleep(3)
+    queue_name = None
+    if queue is not None:
+        queue_name = queues[queue]
+        print(
+            f"Skipping queue detection, waiting for {queue} character selection screen..."
+        )
+    else:
+        print("Waiting for queue to start...")
 
-        # Character selection screen detected, looking for opponent names
-        print("Found character selection screen, looking for opponent names...")
-        opponents = detect_opponent_names(char_select_box, queue_detection["Name"])
-        if (opponents is not None) and (len(opponents) > 0):
-            matches = []
-            for opponent in opponents:
-                leaderboard_entries = leaders.lookup(opponent)
-                if len(leaderboard_entries) > 0:
-                    matches.extend(leaderboard_entries)
-
-            if len(matches) == 0:
-                print(
-                    f"Not found on the leaderboard: {', '.join(opponents)}, have fun!"
-                )
-            else:
-                body = []
-                for match in matches:
-                    body.append(
-                        f"Player: {match['name']} | Queue: {match['queue']} | Rank: {match['rank']} | Gods: {', '.join(match['gods'])}"
-                    )
-
-                utils.print_surrounded("Leaderboard Alert", "\n".join(body))
-            print("Good luck! Waiting for match results...")
-            save_match_results(match_history, opponents, queue_detection["Name"])
-        else:
-            print("No opponents were able to be detected, restarting detection...")
+    if frames is not None:
+        try:
+            set_frame_source(open_frame_source(frames))
+        except RuntimeError as err:
+            raise click.BadParameter(str(err), param_hint="'--frames'")
+    else:
+        set_frame_source(open_screen_source(capture_backend))
+        print(f"Using capture backend: {get_frame_source().name}")
+    load_screens(resolution, queue_name)
+    startup.step("screens")
+    scheduler = ScreenScheduler("start", debug=debug_mode)
+    if frames is not None:
+        # Replayed frames are not real time, don't wait between them
+        scheduler.min_interval = scheduler.max_interval = 0
+    if profile_path is not None:
+        scheduler.profiler = TickProfiler(profile_path, profile_every, profile_slow_ms)
+    MatchWatcher(
+        scheduler,
+        leaders,
+        match_history,
+        queue_name,
+        fuzzy_cutoff,
+        interactive=frames is None,
+    )
+    startup.step("watcher")
+    if startup_profile:
+        print(startup.report())
+    try:
+        scheduler.run()
+    except SourceExhausted:
+        print("Finished replaying frames")
+    except KeyboardInterrupt:
+        stats = screen.get_ocr_cache_stats()
+        print(
+            f"Stopping. OCR cache hits: {stats['hits']} misses: {stats['misses']}"
+        )
+    finally:
+        match_history.close()
+        if log_writer is not None:
+            log_writer.stop()
+        if scheduler.profiler is not None and scheduler.profiler.dump():
+            print(f"Wrote {scheduler.profiler.kept} profiled ticks to {profile_path}")
+        if perf:
+            print(timing.format_summary())
 
 
 if __name__ == "__main__":
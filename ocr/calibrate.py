@@ -0,0 +1,112 @@
+import click
+import itertools
+import json
+import time
+from difflib import SequenceMatcher
+from pathlib import Path
+from PIL import Image
+from typing import Dict, List, Tuple
+from . import engine
+from .profiles import OcrProfile, calibrated_file, load_calibrated, save_calibrated
+from .screen import get_screens
+
+psm_choices = (6, 7, 8, 13)
+scale_choices = (1.0, 2.0, 3.0)
+threshold_choices = (255, 230, 200)
+
+Sample = Tuple[Image.Image, str]
+
+
+def find_box(screens: dict, path: str) -> dict:
+    """Look up a screen by its path in screens.json, e.g. "character_selection/2v2 brawl" """
+    box = screens
+    for part in path.split("/"):
+        box = box[part]
+    return box
+
+
+def collect_samples(frames: Path, expected: dict) -> Dict[str, List[Sample]]:
+    """Labelled crops for every OCR profile, from frames and the expected text per location
+
+    expected maps frame names to screen paths and the text in each of their locations:
+    {"0042.png": {"character_selection/2v2 brawl": ["Name1", "Name2"]}}
+    """
+    samples: Dict[str, List[Sample]] = {}
+    for frame_name, boxes in expected.items():
+        image = Image.open(frames / frame_name).convert("RGB")
+        screens = get_screens(resolution=image.size)
+        for path, texts in boxes.items():
+            box = find_box(screens, path)
+            profile_name = box.get("ocr_profile")
+            if profile_name is None:
+                continue
+            for section, text in zip(box["locations"], texts):
+                crop = image.crop((*section.start, *section.end))
+                samples.setdefault(profile_name, []).append((crop, text))
+    return samples
+
+
+def score(profile: OcrProfile, samples: List[Sample]) -> Tuple[int, float, float]:
+    """Exact reads, mean similarity and seconds per read"""
+    exact = 0
+    similarity = 0.0
+    started = time.perf_counter()
+    for crop, text in samples:
+        read = engine.image_to_string(profile.preprocess(crop), profile.config()).strip()
+        exact += read.lower() == text.lower()
+        similarity += SequenceMatcher(None, read.lower(), text.lower()).ratio()
+    elapsed = time.perf_counter() - started
+    return exact, similarity / len(samples), elapsed / len(samples)
+
+
+def calibrate(base: OcrProfile, samples: List[Sample]) -> Tuple[OcrProfile, Tuple]:
+    """Try every PSM, scale and threshold, keeping the most accurate and then the fastest"""
+    best = None
+    for psm, scale, threshold in itertools.product(
+        psm_choices, scale_choices, threshold_choices
+    ):
+        profile = base._replace(psm=psm, scale=scale, threshold=threshold)
+        result = score(profile, samples)
+        key = (result[0], result[1], -result[2])
+        if best is None or key > best[0]:
+            best = (key, profile, result)
+    return best[1], best[2]
+
+
+@click.command()
+@click.argument("frames", type=click.Path(exists=True, file_okay=False))
+@click.option("--expected", help="JSON file of expected text per location. Defaults to FRAMES/ocr_expected.json.")
+@click.option("--tesseract-cmd", default="tesseract")
+@click.option(
+    "--ocr-backend",
+    default="auto",
+    type=click.Choice(["auto", "tesserocr", "pytesseract"], case_sensitive=True),
+)
+@click.option("--output", default=str(calibrated_file), help="Where the tuned profiles are cached.")
+def run(frames, expected, tesseract_cmd, ocr_backend, output):
+    """Tune the OCR profile of every screen location against labelled screenshots"""
+    engine.configure(tesseract_cmd, ocr_backend)
+    frames = Path(frames)
+    expected_path = Path(expected) if expected is not None else frames / "ocr_expected.json"
+    with open(expected_path) as f:
+        labels = json.load(f)
+
+    screens_data = json.loads((Path(__file__).parent / "screens.json").read_text())
+    defaults = screens_data.get("ocr_profiles", {})
+    profiles = load_calibrated(Path(output))
+    for name, samples in collect_samples(frames, labels).items():
+        base = OcrProfile(**defaults.get(name, {}))
+        before = score(base, samples)
+        profile, after = calibrate(base, samples)
+        profiles[name] = profile
+        print(
+            f"{name}: {len(samples)} samples, exact {before[0]} -> {after[0]}, "
+            f"{before[2] * 1000:.1f} -> {after[2] * 1000:.1f} ms/read, {profile.config()} "
+            f"scale {profile.scale} threshold {profile.threshold}"
+        )
+    save_calibrated(profiles, Path(output))
+    print(f"Saved profiles to {output}")
+
+
+if __name__ == "__main__":
+    run()
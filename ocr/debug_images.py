@@ -0,0 +1,130 @@
+import atexit
+import itertools
+import queue
+import threading
+from collections import deque
+from datetime import datetime as dt
+from pathlib import Path
+from PIL import Image, ImageChops
+from typing import Deque, Tuple
+from perf.timing import count
+
+# Pillow's fastest PNG setting, debug crops are small so the size barely changes
+png_compress_level = 1
+
+
+class DebugImageWriter(object):
+    """Saves debug crops on a background thread, so debug runs keep their real timing
+
+    Writes go through a bounded queue and are dropped, not waited for, when the disk
+    can't keep up. With ring_size set, crops are only kept in memory, the last
+    ring_size of them, until flush_ring is called when a detection fails.
+    """
+
+    def __init__(
+        self,
+        directory="debug",
+        max_queue: int = 64,
+        ring_size: int = 0,
+        image_format: str = "png",
+    ):
+        self.directory = Path(directory)
+        self.ring_size = ring_size
+        self.image_format = image_format
+        self.ring: Deque[Tuple[str, Image.Image]] = deque(maxlen=max(ring_size, 1))
+        self.writes: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._sequence = itertools.count()
+        self._thread = threading.Thread(
+            target=self._write_loop, name="debug-images", daemon=True
+        )
+        self._thread.start()
+
+    def _name(self, label: str) -> str:
+        return f"{dt.now().strftime('%Y-%m-%d-%H_%M_%S_%f')}-{next(self._sequence):05d}-{label}"
+
+    def _enqueue(self, directory: Path, name: str, image: Image.Image):
+        try:
+            self.writes.put_nowait((directory, name, image))
+        except queue.Full:
+            count("debug_images_dropped")
+
+    def save(self, label: str, image: Image.Image):
+        """Write image (and its inverse) in the background, or keep it in the ring buffer"""
+        name = self._name(label)
+        if self.ring_size > 0:
+            self.ring.append((name, image))
+        else:
+            self._enqueue(self.directory, name, image)
+
+    def flush_ring(self, reason: str):
+        """Write out everything in the ring buffer, into a directory named after reason"""
+        directory = self.directory / self._name(reason)
+        while len(self.ring) > 0:
+            name, image = self.ring.popleft()
+            self._enqueue(directory, name, image)
+
+    def _write(self, directory: Path, name: str, image: Image.Image):
+        directory.mkdir(parents=True, exist_ok=True)
+        options = {"compress_level": png_compress_level} if self.image_format == "png" else {}
+        image.save(directory / f"original-{name}.{self.image_format}", **options)
+        ImageChops.invert(image.convert("RGB")).save(
+            directory / f"inverted-{name}.{self.image_format}", **options
+        )
+
+    def _write_loop(self):
+        while True:
+            item = self.writes.get()
+            try:
+                if item is None:
+                    return
+                self._write(*item)
+            except OSError as err:
+                print(f"Failed to save debug image: {err}")
+            finally:
+                self.writes.task_done()
+
+    def close(self):
+        """Finish pending writes and stop the writer thread"""
+        if self._thread.is_alive():
+            self.writes.put(None)
+            self._thread.join()
+
+
+_writer: DebugImageWriter | None = None
+_writer_lock = threading.Lock()
+
+
+def configure(
+    directory="debug", max_queue: int = 64, ring_size: int = 0, image_format: str = "png"
+) -> DebugImageWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+        _writer = DebugImageWriter(directory, max_queue, ring_size, image_format)
+        return _writer
+
+
+def get_writer() -> DebugImageWriter:
+    """The shared writer, created with the defaults on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = DebugImageWriter()
+        return _writer
+
+
+def buffering() -> bool:
+    """True when a ring buffer is configured, so crops should be kept even outside debug mode"""
+    return _writer is not None and _writer.ring_size > 0
+
+
+def flush_ring(reason: str):
+    if _writer is not None:
+        _writer.flush_ring(reason)
+
+
+@atexit.register
+def _close():
+    if _writer is not None:
+        _writer.close()
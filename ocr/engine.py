@@ -0,0 +1,165 @@
+import shlex
+import threading
+from pathlib import Path
+from PIL import Image
+from typing import Dict, Tuple
+
+DEFAULT_PSM = 3
+
+
+def parse_config(config: str | None) -> Tuple[int, Dict[str, str]]:
+    """Split a tesseract command line style config into its PSM and -c variables"""
+    psm = DEFAULT_PSM
+    variables = {}
+    if not config:
+        return psm, variables
+    tokens = shlex.split(config)
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "--psm" and i + 1 < len(tokens):
+            psm = int(tokens[i + 1])
+            i += 1
+        elif token == "-c" and i + 1 < len(tokens):
+            key, _, value = tokens[i + 1].partition("=")
+            variables[key] = value
+            i += 1
+        i += 1
+    return psm, variables
+
+
+class OcrEngine(object):
+    name = "base"
+
+    def image_to_string(self, image: Image.Image, config: str | None = None) -> str:
+        raise NotImplementedError
+
+    def warm_up(self):
+        """Load whatever the calling thread needs before its first read"""
+        pass
+
+    def close(self):
+        pass
+
+
+def load_tesserocr():
+    """Import tesserocr on first use, None if it isn't installed"""
+    try:
+        import tesserocr
+    except ImportError:
+        return None
+    return tesserocr
+
+
+class PytesseractEngine(OcrEngine):
+    """Spawns the tesseract executable for every call"""
+
+    name = "pytesseract"
+
+    def __init__(self, tesseract_cmd: str | None = None):
+        self.tesseract_cmd = tesseract_cmd
+        self._pytesseract = None
+
+    def image_to_string(self, image: Image.Image, config: str | None = None) -> str:
+        self.warm_up()
+        return self._pytesseract.image_to_string(image, config=config or "")
+
+    def warm_up(self):
+        # Imported on the first read so startup doesn't pay for it
+        if self._pytesseract is None:
+            import pytesseract
+
+            if self.tesseract_cmd is not None:
+                pytesseract.pytesseract.tesseract_cmd = self.tesseract_cmd
+            self._pytesseract = pytesseract
+
+
+class TesserocrEngine(OcrEngine):
+    """Keeps libtesseract loaded in-process, with one API handle per thread"""
+
+    name = "tesserocr"
+
+    def __init__(self, tessdata_path: str | None = None, lang="eng"):
+        self.tesserocr = load_tesserocr()
+        if self.tesserocr is None:
+            raise RuntimeError("tesserocr is not installed")
+        self.tessdata_path = tessdata_path
+        self.lang = lang
+        self._local = threading.local()
+        self._apis = []
+        self._lock = threading.Lock()
+        # Fail early if the tessdata or language can't be loaded
+        self._get_api()
+
+    def _get_api(self):
+        api = getattr(self._local, "api", None)
+        if api is None:
+            kwargs = {"lang": self.lang}
+            if self.tessdata_path is not None:
+                kwargs["path"] = self.tessdata_path
+            api = self.tesserocr.PyTessBaseAPI(**kwargs)
+            self._local.api = api
+            with self._lock:
+                self._apis.append(api)
+        return api
+
+    def warm_up(self):
+        self._get_api()
+
+    def image_to_string(self, image: Image.Image, config: str | None = None) -> str:
+        psm, variables = parse_config(config)
+        api = self._get_api()
+        api.SetPageSegMode(psm)
+        defaults = {}
+        for key, value in variables.items():
+            defaults[key] = api.GetVariableAsString(key) or ""
+            api.SetVariable(key, value)
+        try:
+            api.SetImage(image)
+            return api.GetUTF8Text()
+        finally:
+            for key, value in defaults.items():
+                api.SetVariable(key, value)
+
+    def close(self):
+        with self._lock:
+            for api in self._apis:
+                api.End()
+            self._apis = []
+        self._local = threading.local()
+
+
+_engine: OcrEngine | None = None
+
+
+def configure(tesseract_cmd: str | None = None, backend: str = "auto") -> OcrEngine:
+    """Select the OCR backend, preferring the persistent tesserocr engine when available"""
+    global _engine
+    if _engine is not None:
+        _engine.close()
+    _engine = None
+    if backend in ("auto", "tesserocr") and load_tesserocr() is not None:
+        tessdata_path = None
+        if tesseract_cmd is not None:
+            candidate = Path(tesseract_cmd).parent / "tessdata"
+            if candidate.exists():
+                tessdata_path = str(candidate)
+        try:
+            _engine = TesserocrEngine(tessdata_path)
+        except RuntimeError as err:
+            if backend == "tesserocr":
+                raise
+            print(f"tesserocr unavailable ({err}), falling back to pytesseract")
+    if _engine is None:
+        _engine = PytesseractEngine(tesseract_cmd)
+    return _engine
+
+
+def get_engine() -> OcrEngine:
+    if _engine is None:
+        return configure()
+    return _engine
+
+
+def image_to_string(image: Image.Image, config: str | None = None) -> str:
+    return get_engine().image_to_string(image, config)
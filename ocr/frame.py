@@ -0,0 +1,307 @@
+import numpy as np
+from PIL import Image
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
+from perf.timing import timed
+from .color import Color
+from .geometry import Pixel, Bounds
+from .planner import plan_regions
+
+
+class Frame(object):
+    """A single screen capture shared by every Checkpoint and Section in a tick"""
+
+    def __init__(self, image: Image.Image, origin: Pixel = Pixel(0, 0)):
+        self.image = image
+        self.origin = origin
+
+    def _offset(self, pixel: Pixel) -> Pixel:
+        return Pixel(pixel.x - self.origin.x, pixel.y - self.origin.y)
+
+    def crop(self, bounds: Bounds) -> Image.Image:
+        start = self._offset(bounds.start)
+        end = self._offset(bounds.end)
+        return self.image.crop((*start, *end))
+
+    def get_pixel(self, pixel: Pixel) -> Color:
+        r, g, b = self.image.getpixel(self._offset(pixel))[:3]
+        return Color(r, g, b)
+
+    def contains_points(self, points: np.ndarray) -> np.ndarray:
+        xs = points[:, 0] - self.origin.x
+        ys = points[:, 1] - self.origin.y
+        return (xs >= 0) & (ys >= 0) & (xs < self.image.width) & (ys < self.image.height)
+
+    def sample_points(self, points: np.ndarray, patch: int = 0) -> np.ndarray:
+        """Colors at an (n, 2) array of absolute x, y points, averaged over a (2 * patch + 1) square
+
+        Only the sampled pixels are read. Converting a full desktop capture to an array
+        costs far more than the dozen or so checkpoints a tick looks at.
+        """
+        width, height = self.image.size
+        colors = np.empty((len(points), 3))
+        xs = (points[:, 0] - self.origin.x).tolist()
+        ys = (points[:, 1] - self.origin.y).tolist()
+        for i, (x, y) in enumerate(zip(xs, ys)):
+            if patch == 0:
+                colors[i] = self.image.getpixel((x, y))[:3]
+                continue
+            box = (
+                max(x - patch, 0),
+                max(y - patch, 0),
+                min(x + patch + 1, width),
+                min(y + patch + 1, height),
+            )
+            colors[i] = np.asarray(self.image.crop(box))[..., :3].reshape(-1, 3).mean(axis=0)
+        return colors
+
+    def contains(self, bounds: Bounds) -> bool:
+        return (
+            self.origin.x <= bounds.start.x
+            and self.origin.y <= bounds.start.y
+            and bounds.end.x <= self.origin.x + self.image.width
+            and bounds.end.y <= self.origin.y + self.image.height
+        )
+
+
+class RegionFrame(object):
+    """Several captured rectangles taken in the same tick, served by offset like one Frame"""
+
+    def __init__(self, frames: List[Frame]):
+        self.frames = frames
+
+    def _frame_for(self, bounds: Bounds) -> Frame:
+        for frame in self.frames:
+            if frame.contains(bounds):
+                return frame
+        raise ValueError(f"{bounds} is outside every captured region")
+
+    def crop(self, bounds: Bounds) -> Image.Image:
+        return self._frame_for(bounds).crop(bounds)
+
+    def get_pixel(self, pixel: Pixel) -> Color:
+        return self._frame_for(Bounds(pixel, Pixel(pixel.x + 1, pixel.y + 1))).get_pixel(
+            pixel
+        )
+
+    def sample_points(self, points: np.ndarray, patch: int = 0) -> np.ndarray:
+        colors = np.empty((len(points), 3))
+        remaining = np.ones(len(points), dtype=bool)
+        for frame in self.frames:
+            indices = np.flatnonzero(remaining & frame.contains_points(points))
+            if len(indices) == 0:
+                continue
+            remaining[indices] = False
+            colors[indices] = frame.sample_points(points[indices], patch)
+        if remaining.any():
+            raise ValueError("Some points are outside every captured region")
+        return colors
+
+
+class SourceExhausted(Exception):
+    pass
+
+
+class FrameSource(object):
+    name = "base"
+    # Fixed cost of one extra grab in pixels copied, for sources that can capture just a
+    # rectangle. None means every grab costs a full frame, so one is taken per tick.
+    grab_cost: int | None = None
+
+    def grab(self, bounds: Bounds | None) -> Frame:
+        raise NotImplementedError
+
+    def resolution(self) -> Tuple[int, int]:
+        raise NotImplementedError
+
+    def grab_regions(self, regions: List[Bounds]) -> Frame | RegionFrame:
+        """Capture several rectangles for one tick. Replay sources return one full frame."""
+        return self.grab(None)
+
+
+class ScreenSource(FrameSource):
+    """Live captures of the desktop through Pillow's ImageGrab
+
+    On Windows and X11 ImageGrab copies the whole desktop even when given a bbox, so
+    each tick takes one full capture and every region is cropped from it.
+    """
+
+    name = "screen"
+
+    def grab(self, bounds: Bounds | None) -> Frame:
+        from PIL import ImageGrab
+
+        if bounds is None:
+            return Frame(ImageGrab.grab())
+        return Frame(ImageGrab.grab(bbox=[*bounds.start, *bounds.end]), bounds.start)
+
+    def resolution(self) -> Tuple[int, int]:
+        from PIL import ImageGrab
+
+        return ImageGrab.grab().size
+
+
+class MssSource(FrameSource):
+    """Live captures through mss, which copies only the requested rectangle"""
+
+    name = "mss"
+    grab_cost = 100_000
+
+    def __init__(self):
+        try:
+            import mss
+        except ImportError:
+            raise RuntimeError("mss is required for the mss capture backend")
+        try:
+            self.mss = mss.mss()
+        except mss.exception.ScreenShotError as err:
+            raise RuntimeError(f"mss can't capture this display: {err}")
+
+    def grab(self, bounds: Bounds | None) -> Frame:
+        # Coordinates are relative to the primary monitor, like ImageGrab's
+        primary = self.mss.monitors[1]
+        if bounds is None:
+            bounds = Bounds(Pixel(0, 0), Pixel(primary["width"], primary["height"]))
+        shot = self.mss.grab(
+            {
+                "left": primary["left"] + bounds.start.x,
+                "top": primary["top"] + bounds.start.y,
+                "width": bounds.width,
+                "height": bounds.height,
+            }
+        )
+        image = Image.frombytes("RGB", shot.size, shot.bgra, "raw", "BGRX")
+        return Frame(image, bounds.start)
+
+    def resolution(self) -> Tuple[int, int]:
+        primary = self.mss.monitors[1]
+        return primary["width"], primary["height"]
+
+    def grab_regions(self, regions: List[Bounds]) -> Frame | RegionFrame:
+        if len(regions) == 1:
+            return self.grab(regions[0])
+        return RegionFrame([self.grab(region) for region in regions])
+
+
+def open_screen_source(backend: str = "auto") -> FrameSource:
+    """The live capture source, preferring mss when it is installed"""
+    if backend in ("auto", "mss"):
+        try:
+            return MssSource()
+        except RuntimeError:
+            if backend == "mss":
+                raise
+    return ScreenSource()
+
+
+class ImageSource(FrameSource):
+    """Replays recorded full-screen images, advancing one image per grab"""
+
+    name = "images"
+
+    def __init__(self, images: Iterator[Image.Image]):
+        self.images = images
+        self.current: Image.Image | None = None
+        self.index = -1
+
+    def next_image(self) -> Image.Image:
+        try:
+            return next(self.images)
+        except StopIteration:
+            raise SourceExhausted()
+
+    def grab(self, bounds: Bounds | None) -> Frame:
+        self.current = self.next_image().convert("RGB")
+        self.index += 1
+        return Frame(self.current)
+
+
+class DirectorySource(ImageSource):
+    """Replays a directory of screenshots (PNG/JPG) in file name order"""
+
+    name = "directory"
+
+    def __init__(self, directory, loop=False):
+        self.paths = sorted(
+            p
+            for p in Path(directory).iterdir()
+            if p.suffix.lower() in (".png", ".jpg", ".jpeg", ".bmp")
+        )
+        if len(self.paths) == 0:
+            raise RuntimeError(f"No screenshots (.png, .jpg, .jpeg or .bmp) in {directory}")
+        self.loop = loop
+        ImageSource.__init__(self, iter(()))
+
+    def next_image(self) -> Image.Image:
+        position = self.index + 1
+        if position >= len(self.paths):
+            if not self.loop:
+                raise SourceExhausted()
+            position %= len(self.paths)
+        return Image.open(self.paths[position])
+
+    def resolution(self) -> Tuple[int, int]:
+        with Image.open(self.paths[0]) as image:
+            return image.size
+
+    @property
+    def current_path(self) -> Path | None:
+        if self.index < 0:
+            return None
+        return self.paths[self.index % len(self.paths)]
+
+
+class VideoSource(ImageSource):
+    """Replays a screen recording frame by frame, requires opencv-python"""
+
+    name = "video"
+
+    def __init__(self, path, step=1):
+        try:
+            import cv2
+        except ImportError:
+            raise RuntimeError("opencv-python is required to replay video files")
+        self.capture = cv2.VideoCapture(str(path))
+        self.step = step
+        self._cv2 = cv2
+        ImageSource.__init__(self, iter(()))
+
+    def resolution(self) -> Tuple[int, int]:
+        return (
+            int(self.capture.get(self._cv2.CAP_PROP_FRAME_WIDTH)),
+            int(self.capture.get(self._cv2.CAP_PROP_FRAME_HEIGHT)),
+        )
+
+    def next_image(self) -> Image.Image:
+        for _ in range(self.step - 1):
+            self.capture.grab()
+        ok, data = self.capture.read()
+        if not ok:
+            raise SourceExhausted()
+        return Image.fromarray(self._cv2.cvtColor(data, self._cv2.COLOR_BGR2RGB))
+
+
+_source: FrameSource = ScreenSource()
+
+
+def set_frame_source(source: FrameSource):
+    global _source
+    _source = source
+
+
+def get_frame_source() -> FrameSource:
+    return _source
+
+
+def grab_frame(sections: Iterable | None = None) -> Frame | RegionFrame:
+    """Grab the planned capture rectangles covering the given sections, or the whole screen
+
+    Sources that can't capture a rectangle cheaply always grab the whole screen once.
+    """
+    regions = []
+    if sections is not None and _source.grab_cost is not None:
+        regions = plan_regions(sections, _source.grab_cost)
+    with timed("capture"):
+        if len(regions) == 0:
+            return _source.grab(None)
+        return _source.grab_regions(regions)
@@ -0,0 +1,19 @@
+from typing import NamedTuple
+
+
+class Pixel(NamedTuple):
+    x: int
+    y: int
+
+
+class Bounds(NamedTuple):
+    start: Pixel
+    end: Pixel
+
+    @property
+    def width(self) -> int:
+        return self.end.x - self.start.x
+
+    @property
+    def height(self) -> int:
+        return self.end.y - self.start.y
@@ -1,36 +1,58 @@
 #! /usr/bin/env python3
 
-from PIL import Image, ImageGrab, ImageChops
-from typing import List
-from .screen import Section, Checkpoint
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import List, Set
+from perf.timing import count
+from .screen import Section
+from .frame import Frame, grab_frame
+from . import debug_images, engine
 
 
-def detect_screen(box_item: dict, debug=False, test_threshold=None) -> bool | None:
-    checkpoints = box_item["checkpoints"]
-    checks_passed = test_checkpoints(checkpoints, debug, test_threshold)
-    return checks_passed
+_executor: ThreadPoolExecutor | None = None
+# Sections still being read by a worker. A running future can't be cancelled, and
+# get_text mutates the Section, so these are skipped until their read finishes.
+_in_flight: Set[Section] = set()
+_in_flight_lock = threading.Lock()
 
 
-def test_checkpoints(checkpoints: List[Checkpoint], debug=False, threshold=None) -> bool | None:
-    results = []
-    for checkpoint in checkpoints:
-        if checkpoint.test():
-            results.append(True)
-        # Future Debugging
-        else:
-            if debug:
-                print(
-                    f"Checkpoint failed: pixel {[(checkpoint.bounds.start.x + checkpoint.center.x), (checkpoint.start.y + checkpoint.center.y)]}, color {checkpoint.color}"
-                )
-
-    # If we have more than half the checkpoints, we're good
-    if threshold is not None:
-       if len(results) >= threshold:
-           return True 
-    else:
-        if len(results) == len(checkpoints):
-            return True
-    return False
+def _warm_up_worker():
+    engine.get_engine().warm_up()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Shared OCR thread pool, sized to the number of cores, each worker loading the engine on start"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=os.cpu_count() or 1,
+            thread_name_prefix="ocr",
+            initializer=_warm_up_worker,
+        )
+    return _executor
+
+
+def _submit(executor: ThreadPoolExecutor, section: Section, *args) -> Future | None:
+    """Read section on the pool, None if an earlier read of it is still running"""
+    with _in_flight_lock:
+        if section in _in_flight:
+            return None
+        _in_flight.add(section)
+
+    def release(_):
+        with _in_flight_lock:
+            _in_flight.discard(section)
+
+    future = executor.submit(section.get_text, *args)
+    future.add_done_callback(release)
+    return future
+
+
+def in_flight(section: Section) -> bool:
+    with _in_flight_lock:
+        return section in _in_flight
 
 
 def process_locations(
@@ -39,15 +61,54 @@ def process_locations(
     use_inverted=True,
     config=None,
     debug=False,
-) -> List[str]:
-    """Given a list of boxes, return a list of strings of the text in each box"""
+    frame: Frame | None = None,
+    concurrent=False,
+    deadline: float | None = None,
+) -> List[str | None]:
+    """Given a list of boxes, return a list of strings of the text in each box
+
+    With concurrent=True all sections are OCR'd at once on the shared thread pool.
+    deadline is the number of seconds to wait for results. Sections that weren't read
+    in time, or are still being read from an earlier call, come back as None so the
+    caller can tell a missed read from an empty one. Empty texts are left out, results
+    otherwise keep the order of locations.
+    """
+    if frame is None:
+        frame = grab_frame(locations)
+    texts = []
+    if concurrent and len(locations) > 1:
+        executor = get_executor()
+        futures = [
+            _submit(executor, section, text_to_lower, use_inverted, config, frame)
+            for section in locations
+        ]
+        wait([future for future in futures if future is not None], timeout=deadline)
+        for future in futures:
+            if future is not None and future.done():
+                texts.append(future.result())
+            else:
+                count("ocr_deadline_missed")
+                texts.append(None)
+    else:
+        started = time.monotonic()
+        for section in locations:
+            if in_flight(section) or (
+                deadline is not None and time.monotonic() - started > deadline
+            ):
+                count("ocr_deadline_missed")
+                texts.append(None)
+                continue
+            texts.append(section.get_text(text_to_lower, use_inverted, config, frame))
+
     results = []
-    for section in locations:
-        if debug:
+    for section, boxText in zip(locations, texts):
+        if boxText is None:
+            results.append(None)
+            continue
+        if debug or debug_images.buffering():
             section.save_debug_image()
-        boxText = section.get_text(text_to_lower, use_inverted, config)
 
-        if (boxText is not None) and (len(boxText) > 0):
+        if len(boxText) > 0:
             results.append(boxText)
     return results
 
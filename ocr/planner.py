@@ -0,0 +1,45 @@
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+from .geometry import Pixel, Bounds
+
+
+def area(bounds: Bounds) -> int:
+    return (bounds.end.x - bounds.start.x) * (bounds.end.y - bounds.start.y)
+
+
+def merge(a: Bounds, b: Bounds) -> Bounds:
+    return Bounds(
+        Pixel(min(a.start.x, b.start.x), min(a.start.y, b.start.y)),
+        Pixel(max(a.end.x, b.end.x), max(a.end.y, b.end.y)),
+    )
+
+
+@lru_cache(maxsize=64)
+def _plan(boxes: Tuple[Bounds, ...], cost: int) -> Tuple[Bounds, ...]:
+    regions = list(boxes)
+    while len(regions) > 1:
+        # Greedily merge the pair that saves the most, until no merge pays for itself
+        best = None
+        best_saving = 0
+        for i in range(len(regions)):
+            for j in range(i + 1, len(regions)):
+                merged = merge(regions[i], regions[j])
+                saving = area(regions[i]) + area(regions[j]) + cost - area(merged)
+                if saving > best_saving:
+                    best, best_saving = (i, j, merged), saving
+        if best is None:
+            break
+        i, j, merged = best
+        regions = [r for k, r in enumerate(regions) if k not in (i, j)] + [merged]
+    return tuple(sorted(regions))
+
+
+def plan_regions(sections: Iterable, cost: int) -> List[Bounds]:
+    """Merge the bounds of the given Sections/Checkpoints into a small set of capture rectangles
+
+    Boxes are merged while the extra pixels copied cost less than another grab would,
+    cost being the fixed price of one grab in pixels copied.
+    Plans are cached, so calling this every tick with the same sections is cheap.
+    """
+    boxes = tuple(sorted({Bounds(s.start, s.end) for s in sections}))
+    return list(_plan(boxes, cost))
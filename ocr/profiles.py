@@ -0,0 +1,61 @@
+import json
+import shlex
+from pathlib import Path
+from PIL import Image
+from typing import Dict, NamedTuple
+from .utils import sanitize_image
+
+# Tuned profiles written by `python -m ocr.calibrate`, overriding screens.json
+calibrated_file = Path(__file__).parent / "ocr_profiles.json"
+
+
+class OcrProfile(NamedTuple):
+    """How one Section's crop is preprocessed and read"""
+
+    psm: int = 3
+    whitelist: str | None = None
+    scale: float = 1.0
+    threshold: int = 255
+
+    def config(self) -> str:
+        config = f"--psm {self.psm}"
+        if self.whitelist:
+            config += " -c " + shlex.quote(f"tessedit_char_whitelist={self.whitelist}")
+        return config
+
+    def preprocess(self, image: Image.Image, invert: bool = True) -> Image.Image:
+        """Binarize, then upscale with NEAREST so every stroke pixel is kept and widened
+
+        Interpolating before an exact-white threshold would drop edge pixels below it
+        and thin the strokes instead.
+        """
+        image = sanitize_image(image, self.threshold, invert)
+        if self.scale != 1.0:
+            size = (round(image.width * self.scale), round(image.height * self.scale))
+            image = image.resize(size, Image.NEAREST)
+        return image
+
+    def to_json(self) -> dict:
+        return {k: v for k, v in self._asdict().items() if v != self._field_defaults[k]}
+
+
+default_profile = OcrProfile()
+
+
+def load_calibrated(path: Path = calibrated_file) -> Dict[str, OcrProfile]:
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return {name: OcrProfile(**values) for name, values in json.load(f).items()}
+
+
+def save_calibrated(profiles: Dict[str, OcrProfile], path: Path = calibrated_file):
+    with open(path, "w") as f:
+        json.dump({name: profile.to_json() for name, profile in profiles.items()}, f, indent=2)
+
+
+def build_profiles(data: Dict[str, dict], path: Path = calibrated_file) -> Dict[str, OcrProfile]:
+    """Profiles from screens.json, with any calibrated ones taking their place"""
+    profiles = {name: OcrProfile(**values) for name, values in data.items()}
+    profiles.update(load_calibrated(path))
+    return profiles
@@ -0,0 +1,121 @@
+import time
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple
+from perf.profiling import TickProfiler
+from perf.timing import count, timed
+from .frame import Frame, grab_frame
+from .signatures import ScreenClassifier
+
+
+class Transition(NamedTuple):
+    previous: str
+    current: str
+    frame: Frame
+
+
+class ScreenScheduler(object):
+    """Screen state machine driven by one capture per tick.
+
+    Each tick grabs a single frame covering every registered screen and classifies it
+    against all of them at once, so a skipped screen can't leave the loop stuck waiting.
+    Enter handlers fire when a different screen is recognised, tick handlers get the
+    frame while the current screen is still showing. The poll interval drops to
+    min_interval after a transition and backs off towards max_interval while idle.
+    In debug mode, ticks that match no screen print the failed checkpoints of the
+    screen expected after the current one.
+    """
+
+    def __init__(
+        self,
+        initial: str,
+        min_interval: float = 0.1,
+        max_interval: float = 2.0,
+        backoff: float = 1.5,
+        debug=False,
+    ):
+        self.state = initial
+        self.screens: Dict[str, dict] = {}
+        self.classifier: ScreenClassifier | None = None
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.debug = debug
+        self.profiler: TickProfiler | None = None
+        self.enter_handlers: Dict[str, List[Callable[[Transition], None]]] = defaultdict(list)
+        self.tick_handlers: Dict[str, List[Callable[[Frame], None]]] = defaultdict(list)
+        self.expected: Dict[str, str] = {}
+
+    def set_screen(self, state: str, box: dict | None):
+        """Set the SCREENS entry used to recognise a state, None to stop recognising it"""
+        if box is None:
+            self.screens.pop(state, None)
+        else:
+            self.screens[state] = box
+        self.classifier = None
+
+    def on_enter(self, state: str, handler: Callable[[Transition], None]):
+        self.enter_handlers[state].append(handler)
+
+    def on_tick(self, state: str, handler: Callable[[Frame], None]):
+        self.tick_handlers[state].append(handler)
+
+    def expect(self, state: str, next_state: str):
+        """Declare the screen that normally follows state, for debug output"""
+        self.expected[state] = next_state
+
+    def print_failed(self, frame: Frame):
+        expected = self.expected.get(self.state)
+        if expected not in self.screens:
+            return
+        for checkpoint in self.classifier.failed(frame, expected):
+            print(
+                f"Checkpoint failed ({expected}): pixel {list(checkpoint.point)}, color {checkpoint.color}"
+            )
+
+    def transition(self, state: str, frame: Frame):
+        previous = self.state
+        self.state = state
+        self.interval = self.min_interval
+        count("transitions")
+        if self.debug:
+            print(f"[scheduler] {previous} -> {state}")
+        for handler in self.enter_handlers[state]:
+            handler(Transition(previous, state, frame))
+
+    def tick(self) -> bool:
+        """Run one poll, returning True if the state changed"""
+        with timed("tick"):
+            return self._tick()
+
+    def _tick(self) -> bool:
+        if len(self.screens) == 0:
+            return False
+        if self.classifier is None:
+            self.classifier = ScreenClassifier(self.screens)
+        # Locations are captured too, so enter handlers can OCR from the same frame
+        sections = []
+        for box in self.screens.values():
+            sections.extend(box["checkpoints"])
+            sections.extend(box.get("locations", []))
+        frame = grab_frame(sections)
+
+        match = self.classifier.best(frame)
+        if match is None:
+            if self.debug:
+                self.print_failed(frame)
+            return False
+        if match.name != self.state:
+            self.transition(match.name, frame)
+            return True
+        for handler in self.tick_handlers[self.state]:
+            handler(frame)
+        return False
+
+    def run(self, stop: threading.Event | None = None):
+        while stop is None or not stop.is_set():
+            changed = self.tick() if self.profiler is None else self.profiler.run(self.tick)
+            if not changed:
+                self.interval = min(self.interval * self.backoff, self.max_interval)
+            time.sleep(self.interval)
@@ -1,77 +1,121 @@
-import pytesseract
-from PIL import ImageGrab, ImageChops
-from typing import NamedTuple, List
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Dict, Tuple
 from .color import *
-from datetime import datetime as dt
 from pathlib import Path
-from .utils import sanitize_image
+from .profiles import OcrProfile, build_profiles, default_profile
+from .geometry import Pixel, Bounds
+from .frame import grab_frame
+from . import debug_images, engine
+from perf.timing import timed
 
 
 pytess_config = "--psm 3"
+# Number of distinct crops each Section remembers OCR results for
+ocr_cache_size = 8
 
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
 
-class Pixel(NamedTuple):
-    x: int
-    y: int
 
+def get_ocr_cache_stats() -> Dict[str, int]:
+    """OCR result cache hits and misses across every Section"""
+    with _cache_lock:
+        return dict(_cache_stats)
 
-class Bounds(NamedTuple):
-    start: Pixel
-    end: Pixel
+
+def _count_cache(hit: bool):
+    with _cache_lock:
+        _cache_stats["hits" if hit else "misses"] += 1
 
 
 class Section(object):
-    def __init__(self, bounds: Bounds, debug=False):
+    # Screens are built once per resolution, only the OCR state changes afterwards
+    __slots__ = (
+        "bounds",
+        "profile",
+        "start",
+        "end",
+        "width",
+        "height",
+        "center",
+        "point",
+        "image",
+        "ocr_cache",
+        "cache_hits",
+        "cache_misses",
+    )
+
+    def __init__(self, bounds: Bounds, debug=False, profile: OcrProfile | None = None):
         self.bounds = bounds
-        self.start = self.bounds.start
-        self.end = self.bounds.end
-        self.width = self.end.x - self.start.x
-        self.height = self.end.y - self.start.y
-        self.center = Pixel(int(self.width / 2), int(self.height / 2))
+        self.profile = profile
+        self.start = bounds.start
+        self.end = bounds.end
+        self.width = bounds.width
+        self.height = bounds.height
+        self.center = Pixel(self.width // 2, self.height // 2)
+        # Absolute position of the center, the pixel checkpoints sample
+        self.point = Pixel(self.start.x + self.center.x, self.start.y + self.center.y)
         self.image = None
-
-    def grab_image(self):
-        image = ImageGrab.grab(bbox=[*self.start, *self.end])
-        return image
-
-    def get_text(self, to_lower=False, use_inverted=True, config=None) -> str:
+        self.ocr_cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def grab_image(self, frame=None):
+        if frame is None:
+            frame = grab_frame([self])
+        return frame.crop(self.bounds)
+
+    def get_text(
+        self, to_lower=False, use_inverted=True, config=None, frame=None
+    ) -> str:
+        profile = self.profile or default_profile
         if config is None:
-            config = pytess_config
-        self.image = self.grab_image()
-        processed = sanitize_image(self.image)
-        if use_inverted:
-            final_image = ImageChops.invert(processed)
+            config = profile.config() if self.profile is not None else pytess_config
+        self.image = self.grab_image(frame)
+        with timed("sanitize"):
+            final_image = profile.preprocess(self.image, invert=use_inverted)
+        # Keyed on the binarized crop, so background noise under the threshold still hits
+        key = (hashlib.blake2b(final_image.tobytes(), digest_size=16).digest(), config)
+        text = self.ocr_cache.get(key)
+        if text is not None:
+            self.ocr_cache.move_to_end(key)
+            self.cache_hits += 1
+            _count_cache(True)
         else:
-            final_image = processed
-        text = pytesseract.image_to_string(final_image, config=pytess_config).strip()
+            with timed("ocr"):
+                text = engine.image_to_string(final_image, config).strip()
+            self.ocr_cache[key] = text
+            if len(self.ocr_cache) > ocr_cache_size:
+                self.ocr_cache.popitem(last=False)
+            self.cache_misses += 1
+            _count_cache(False)
         if to_lower:
             text = text.lower()
         return text
 
     def save_debug_image(self):
-        print("Saving debug image...")
+        """Queue the last crop for the debug image writer"""
         if self.image is None:
             self.image = self.grab_image()
-        save_suffix = f"{dt.now().strftime('%Y-%m-%d-%H_%M_%S')}.png"
-        debug_save_dir = Path(
-            r"C:\Users\TheBoss\Documents\Development\Github.com\RickyGrassmuck\DKO-Leaderboard-Query\debug"
-        )
-        if not debug_save_dir.exists():
-            debug_save_dir.mkdir(parents=True)
-        ImageChops.invert(self.image).save(
-            debug_save_dir.joinpath(f"inverted-{save_suffix}")
+        label = f"{self.start.x}_{self.start.y}"
+        debug_images.get_writer().save(label, self.image)
+
+    def get_coordinate_color(self, coordinate: Pixel, frame=None):
+        """Return the RGB color of the specified pixel, relative to the section start"""
+        if frame is None:
+            frame = grab_frame([self])
+        return frame.get_pixel(
+            Pixel(self.start.x + coordinate.x, self.start.y + coordinate.y)
         )
-        self.image.save(debug_save_dir.joinpath(f"original-{save_suffix}"))
-
-    def get_coordinate_color(self, coordinate: Pixel):
-        """Given a PIL Image, return the RGB color of the specified pixel"""
-        image = self.grab_image()
-        r, g, b = image.getpixel(coordinate)
-        color = Color(r, g, b)
-        return color
 
 
 class Checkpoint(Section):
+    __slots__ = ("color", "threshold", "name")
+
     def __init__(
         self, coordinates: List[int], color: Color, threshold: int = 6, name=None
     ):
@@ -86,96 +130,85 @@ class Checkpoint(Section):
         self.threshold = threshold
         self.name = name
 
-    def test(self) -> bool | None:
-        pixel_color = self.get_coordinate_color(self.center)
+    def test(self, frame=None) -> bool | None:
+        pixel_color = self.get_coordinate_color(self.center, frame)
         return color_delta(self.color, pixel_color) < self.threshold
 
 
-def new_section(coordinates: List[int], debug=False):
+def new_section(coordinates: List[int], debug=False, profile: OcrProfile | None = None):
     start = Pixel(coordinates[0], coordinates[1])
     end = Pixel(coordinates[2], coordinates[3])
-    return Section(Bounds(start, end))
-
-
-CHECKPOINTS = {
-    "home_screen": [
-        Checkpoint([2197, 89, 2203, 95], Color(10, 113, 155)),
-        Checkpoint([180, 85, 190, 95], Color(255, 255, 255)),
-        Checkpoint([2132, 1112, 2135, 1115], Color(16, 135, 180)),
-    ],
-    "character_select": {
-        "god_select_frame": [
-            Checkpoint([543, 849, 553, 859], Color(7, 108, 144)),
-            Checkpoint([160, 1100, 166, 1106], Color(4, 96, 134)),
-        ],
-        "lock_in_button": [Checkpoint([1058, 1169, 1068, 1179], Color(255, 184, 0))],
-    },
-}
-
-
-def get_screens(debug=False):
-    return {
-        "queue_detection": {
-            "checkpoints": [
-                *CHECKPOINTS["home_screen"],
-            ],
-            "locations": [new_section([2033, 1040, 2235, 1128])],
-            "valid_queues": [
-                {"name": "1v1 duel", "must_contain": ["1", "v", "1"]},
-                {"name": "2v2 brawl", "must_contain": ["2", "v", "2"]},
-                {"name": "3v3 brawl", "must_contain": ["2", "v", "2"]},
-            ],
-        },
-        "match_results": {
-            "2v2 brawl": {
-                "checkpoints": [
-                    Checkpoint([463, 535, 469, 541], Color(0, 107, 151)),
-                    Checkpoint([463, 843, 469, 849], Color(223, 24, 24)),
-                    Checkpoint([463, 535, 469, 541], Color(223, 24, 24)),
-                    Checkpoint([463, 843, 469, 849], Color(0, 107, 151)),
-                ],
-                "locations": [new_section([1025, 240, 1550, 344])],
-            },
-        },
-        "character_selection": {
-            "2v2 brawl": {
-                "checkpoints": [
-                    *CHECKPOINTS["character_select"]["god_select_frame"],
-                    *CHECKPOINTS["character_select"]["lock_in_button"],
-                    Checkpoint(
-                        [2235, 535, 2241, 541], Color(190, 20, 20)
-                    ),  # red_team_box
-                ],
-                "locations": [
-                    new_section([1930, 484, 2218, 519]),
-                    new_section([1958, 612, 2218, 658], debug=True),
-                ],
-            },
-            "3v3 Arcade": {
-                "checkpoints": [
-                    *CHECKPOINTS["character_select"]["god_select_frame"],
-                    *CHECKPOINTS["character_select"]["lock_in_button"],
-                    Checkpoint(
-                        [2235, 930, 2241, 935], Color(190, 20, 20)
-                    ),  # red_team_box3
-                ],
-                "locations": [
-                    new_section([1930, 595, 2218, 650]),
-                    new_section([1930, 730, 2218, 783]),
-                    new_section([1930, 860, 2218, 920]),
-                ],
-            },
-            "1v1 duel": {
-                "checkpoints": [
-                    *CHECKPOINTS["character_select"]["god_select_frame"],
-                    *CHECKPOINTS["character_select"]["lock_in_button"],
-                    Checkpoint(
-                        [2245, 320, 2251, 326], Color(188, 20, 17)
-                    ),  # red_team_box
-                ],
-                "locations": [
-                    new_section([1989, 347, 2213, 387]),
-                ],
-            },
-        },
-    }
+    return Section(Bounds(start, end), profile=profile)
+
+
+screens_file = Path(__file__).parent / "screens.json"
+
+
+@lru_cache(maxsize=4)
+def load_screen_data(path: Path = screens_file) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def scale_coordinates(coordinates: List[int], scale: Tuple[float, float]) -> List[int]:
+    """Scale [x1, y1, x2, y2] from the reference resolution, keeping boxes at least 1px wide"""
+    x1, y1 = round(coordinates[0] * scale[0]), round(coordinates[1] * scale[1])
+    x2, y2 = round(coordinates[2] * scale[0]), round(coordinates[3] * scale[1])
+    return [x1, y1, max(x2, x1 + 1), max(y2, y1 + 1)]
+
+
+def _build_checkpoints(items: list, groups: dict, scale) -> List[Checkpoint]:
+    checkpoints = []
+    for item in items:
+        if isinstance(item, str):
+            checkpoints.extend(_build_checkpoints(groups[item], groups, scale))
+        else:
+            checkpoints.append(
+                Checkpoint(
+                    scale_coordinates(item["bounds"], scale),
+                    Color(*item["color"]),
+                    item.get("threshold", 6),
+                    item.get("name"),
+                )
+            )
+    return checkpoints
+
+
+def _build_screen(data: dict, groups: dict, profiles: dict, scale) -> dict:
+    if "checkpoints" not in data:
+        return {
+            name: _build_screen(item, groups, profiles, scale) for name, item in data.items()
+        }
+    box = dict(data)
+    box["checkpoints"] = _build_checkpoints(data["checkpoints"], groups, scale)
+    profile = profiles.get(data.get("ocr_profile"))
+    box["locations"] = [
+        new_section(scale_coordinates(location, scale), profile=profile)
+        for location in data.get("locations", [])
+    ]
+    return box
+
+
+@lru_cache(maxsize=4)
+def get_screens(
+    debug=False,
+    resolution: Tuple[int, int] | None = None,
+    queues: Tuple[str, ...] | None = None,
+):
+    """Build the screen definitions from screens.json, scaled once to the given resolution
+
+    The result is cached per resolution so the scaling never happens on the polling path.
+    With queues given, per-queue screens are only built for those queues.
+    """
+    data = load_screen_data()
+    reference = data["reference_resolution"]
+    if resolution is None:
+        resolution = tuple(reference)
+    scale = (resolution[0] / reference[0], resolution[1] / reference[1])
+    profiles = build_profiles(data.get("ocr_profiles", {}))
+    screens = {}
+    for name, item in data["screens"].items():
+        if queues is not None and "checkpoints" not in item:
+            item = {queue: item[queue] for queue in queues if queue in item}
+        screens[name] = _build_screen(item, data["checkpoints"], profiles, scale)
+    return screens
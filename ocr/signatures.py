@@ -0,0 +1,101 @@
+import numpy as np
+from typing import Dict, List, NamedTuple, Tuple
+from .screen import Checkpoint
+
+
+class ScreenMatch(NamedTuple):
+    name: str
+    confidence: float
+    matched: bool
+
+
+def flatten_screens(screens: Dict[str, dict], prefix="") -> List[Tuple[str, dict]]:
+    """List every SCREENS entry that has checkpoints, naming nested ones like "match_results/2v2 brawl" """
+    boxes = []
+    for name, item in screens.items():
+        if not isinstance(item, dict):
+            continue
+        if "checkpoints" in item:
+            boxes.append((prefix + name, item))
+        else:
+            boxes.extend(flatten_screens(item, f"{prefix}{name}/"))
+    return boxes
+
+
+class ScreenClassifier(object):
+    """Every screen signature compiled into one table and tested against a frame at once
+
+    Checkpoints shared between screens are only sampled once. Per-screen pass counts come
+    from a single membership matrix product, so adding screens barely changes the cost.
+    """
+
+    def __init__(self, screens: Dict[str, dict]):
+        self.boxes = flatten_screens(screens)
+        self.names = [name for name, _ in self.boxes]
+
+        # A box's sample_patch is part of the key, the same pixel averaged differently is a different check
+        unique = {}
+        self.members: List[List[int]] = []
+        for _, box in self.boxes:
+            patch = box.get("sample_patch", 0)
+            indices = []
+            for c in box["checkpoints"]:
+                key = (*c.point, *c.color, c.threshold, patch)
+                indices.append(unique.setdefault(key, len(unique)))
+            self.members.append(indices)
+        table = np.array(list(unique.keys()), dtype=np.intp).reshape(-1, 7)
+        self.points = table[:, :2]
+        self.colors = table[:, 2:5].astype(np.int16)
+        self.thresholds = table[:, 5]
+        self.patch_groups = [
+            (int(patch), np.flatnonzero(table[:, 6] == patch)) for patch in np.unique(table[:, 6])
+        ]
+
+        self.membership = np.zeros((len(self.boxes), len(unique)), dtype=np.int32)
+        for row, indices in enumerate(self.members):
+            for index in indices:
+                self.membership[row, index] += 1
+        totals = self.membership.sum(axis=1)
+        self.required = np.array(
+            [
+                total if box.get("test_threshold") is None else box["test_threshold"]
+                for total, (_, box) in zip(totals, self.boxes)
+            ]
+        )
+
+    def passed(self, frame) -> np.ndarray:
+        """Pass/fail of every unique checkpoint, sampling once per patch size"""
+        samples = np.empty((len(self.points), 3))
+        for patch, indices in self.patch_groups:
+            samples[indices] = frame.sample_points(self.points[indices], patch)
+        return np.abs(samples - self.colors).sum(axis=1) < self.thresholds
+
+    def failed(self, frame, name: str) -> List[Checkpoint]:
+        """The checkpoints of one screen that don't match the frame"""
+        row = self.names.index(name)
+        passed = self.passed(frame)
+        return [
+            checkpoint
+            for checkpoint, index in zip(self.boxes[row][1]["checkpoints"], self.members[row])
+            if not passed[index]
+        ]
+
+    def classify(self, frame) -> List[ScreenMatch]:
+        """Score every screen against the frame, best match first"""
+        if len(self.boxes) == 0:
+            return []
+        passes = self.membership @ self.passed(frame).astype(np.int32)
+        matched = passes >= self.required
+        confidence = np.minimum(passes / np.maximum(self.required, 1), 1.0)
+        # Among equal confidence, prefer the screen that needed more checkpoints to match
+        order = np.lexsort((-self.required, -confidence, ~matched))
+        return [
+            ScreenMatch(self.names[i], float(confidence[i]), bool(matched[i])) for i in order
+        ]
+
+    def best(self, frame) -> ScreenMatch | None:
+        """The best matching screen, or None if no screen's checkpoints are satisfied"""
+        results = self.classify(frame)
+        if len(results) == 0 or not results[0].matched:
+            return None
+        return results[0]
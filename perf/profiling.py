@@ -0,0 +1,44 @@
+import cProfile
+import pstats
+import time
+from typing import Callable
+
+
+class TickProfiler(object):
+    """Runs every nth tick under cProfile, keeping the stats of the slowest ones
+
+    Profiling only a sample of ticks keeps the overhead low enough to use on a live
+    session. With slow_ms set, only sampled ticks at least that slow are kept.
+    """
+
+    def __init__(self, path, every: int = 1, slow_ms: float | None = None):
+        self.path = path
+        self.every = max(every, 1)
+        self.slow_ms = slow_ms
+        self.ticks = 0
+        self.kept = 0
+        self.stats: pstats.Stats | None = None
+
+    def run(self, tick: Callable[[], bool]) -> bool:
+        self.ticks += 1
+        if self.ticks % self.every != 0:
+            return tick()
+        profile = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            return profile.runcall(tick)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            if self.slow_ms is None or elapsed >= self.slow_ms:
+                self.kept += 1
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+
+    def dump(self):
+        """Write the combined stats for pstats/snakeviz, returning False if nothing was kept"""
+        if self.stats is None:
+            return False
+        self.stats.dump_stats(self.path)
+        return True
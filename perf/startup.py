@@ -0,0 +1,25 @@
+import time
+from typing import List, Tuple
+
+
+class StartupProfile(object):
+    """Wall time of each startup step, from the first import until the watcher is ready"""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.last = started
+        self.steps: List[Tuple[str, float]] = []
+
+    def step(self, name: str, now: float | None = None):
+        """Record the time since the previous step under name, ending now unless given"""
+        if now is None:
+            now = time.perf_counter()
+        self.steps.append((name, now - self.last))
+        self.last = now
+
+    def report(self) -> str:
+        lines = [f"{'startup step':<16}{'ms':>10}"]
+        for name, seconds in self.steps:
+            lines.append(f"{name:<16}{seconds * 1000:>10.1f}")
+        lines.append(f"{'total':<16}{(self.last - self.started) * 1000:>10.1f}")
+        return "\n".join(lines)
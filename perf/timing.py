@@ -0,0 +1,119 @@
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List
+
+enabled = False
+# Percentiles are taken over the most recent window samples of each stage, so memory
+# stays bounded and the numbers track current behaviour on long sessions
+window = 2048
+_samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=window))
+_totals: Dict[str, int] = defaultdict(int)
+_counters: Dict[str, int] = defaultdict(int)
+
+
+def enable(on: bool = True):
+    global enabled
+    enabled = on
+
+
+def record(stage: str, seconds: float):
+    if enabled:
+        _samples[stage].append(seconds)
+        _totals[stage] += 1
+
+
+def count(name: str, amount: int = 1):
+    """Bump a counter, doing nothing while timing is disabled"""
+    if enabled:
+        _counters[name] += amount
+
+
+@contextmanager
+def timed(stage: str):
+    """Record how long the block takes under stage, doing nothing while timing is disabled"""
+    if not enabled:
+        yield
+        return
+    started = time.perf_counter()
+    yield
+    # Blocks that raised aren't recorded
+    _samples[stage].append(time.perf_counter() - started)
+    _totals[stage] += 1
+
+
+def samples() -> Dict[str, List[float]]:
+    return {stage: list(values) for stage, values in _samples.items()}
+
+
+def counters() -> Dict[str, int]:
+    return dict(_counters)
+
+
+def reset():
+    _samples.clear()
+    _totals.clear()
+    _counters.clear()
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if len(sorted_values) == 0:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def summary() -> Dict[str, Dict[str, float]]:
+    """Per stage total count, then mean, p50, p95, p99 and max over the window, in milliseconds"""
+    result = {}
+    for stage, values in list(_samples.items()):
+        ordered = sorted(values)
+        result[stage] = {
+            "count": _totals[stage],
+            "mean": sum(ordered) / len(ordered) * 1000 if ordered else 0.0,
+            "p50": percentile(ordered, 0.5) * 1000,
+            "p95": percentile(ordered, 0.95) * 1000,
+            "p99": percentile(ordered, 0.99) * 1000,
+            "max": ordered[-1] * 1000 if ordered else 0.0,
+        }
+    return result
+
+
+def format_summary() -> str:
+    lines = [f"{'stage':<10}{'count':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)"]
+    for stage, stats in summary().items():
+        lines.append(
+            f"{stage:<10}{stats['count']:>8}{stats['mean']:>10.2f}{stats['p50']:>10.2f}"
+            f"{stats['p95']:>10.2f}{stats['p99']:>10.2f}{stats['max']:>10.2f}"
+        )
+    for name, value in counters().items():
+        lines.append(f"{name:<10}{value:>8}")
+    return "\n".join(lines)
+
+
+def write_log(path):
+    """Append the current summary and counters to a JSON lines file"""
+    entry = {"time": time.time(), "stages": summary(), "counters": counters()}
+    with open(path, "a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+
+class LogWriter(object):
+    """Appends a summary to a JSON lines log every interval seconds on a daemon thread"""
+
+    def __init__(self, path, interval: float = 60):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="perf-log", daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            write_log(self.path)
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        write_log(self.path)
@@ -0,0 +1,94 @@
+import click
+import time
+from tabulate import tabulate
+from .matches import MatchHistory
+from .snapshots import LeaderboardHistory
+from . import export
+
+
+def check_path(path):
+    try:
+        export.check_format(path)
+    except ValueError as err:
+        raise click.BadParameter(str(err), param_hint="PATH")
+
+
+@click.group()
+def cli():
+    """Export, import and merge match history"""
+
+
+@cli.command("export-history")
+@click.argument("path")
+@click.option("--db", default="match_history.db", help="Match history database.")
+def export_history(path, db):
+    """Export the full match history to PATH (.csv, .parquet, .arrow or .feather)"""
+    check_path(path)
+    history = MatchHistory(db)
+    count = export.export_rows(export.iter_history(history), path, export.history_fields)
+    history.close()
+    click.echo(f"Exported {count} matches to {path}")
+
+
+@cli.command("import-history")
+@click.argument("path")
+@click.option("--db", default="match_history.db", help="Match history database.")
+def import_history(path, db):
+    """Append the matches in an export at PATH to the match history, skipping ones it already has"""
+    check_path(path)
+    history = MatchHistory(db)
+    try:
+        count = export.import_history(history, export.read_rows(path))
+    except ValueError as err:
+        raise click.BadParameter(str(err), param_hint="PATH")
+    finally:
+        history.close()
+    click.echo(f"Imported {count} matches from {path}")
+
+
+@cli.command("export-leaderboard")
+@click.argument("path")
+@click.option(
+    "--leaderboard-cache",
+    default="leaderboard_cache.json.gz",
+    help="Cached leaderboard to export. Fetched if there is no cache yet.",
+)
+def export_leaderboard(path, leaderboard_cache):
+    """Export the current leaderboard snapshot to PATH (.csv, .parquet, .arrow or .feather)"""
+    check_path(path)
+    from dko_api.cache import LeaderboardCache
+    from dko_api.lookup import Leaderboard
+
+    leaderboard = Leaderboard(cache=LeaderboardCache(leaderboard_cache))
+    count = export.export_rows(
+        export.iter_leaderboard(leaderboard), path, export.leaderboard_fields
+    )
+    click.echo(f"Exported {count} leaderboard rows to {path}")
+
+
+@cli.command("rank-history")
+@click.argument("player")
+@click.option("--queue", help="Only show this queue, e.g. '1v1 duel'.")
+@click.option("--db", default="leaderboard_history.db", help="Leaderboard history database.")
+def rank_history(player, queue, db):
+    """Show how PLAYER's leaderboard rank changed over time"""
+    history = LeaderboardHistory(db)
+    rows = [
+        [
+            time.strftime("%Y-%m-%d %H:%M", time.localtime(change.fetched_at)),
+            change.queue,
+            change.name,
+            "-" if change.rank is None else change.rank,
+            ", ".join(change.gods),
+        ]
+        for change in history.rank_history(player, queue)
+    ]
+    history.close()
+    if len(rows) == 0:
+        click.echo(f"No leaderboard history for {player}")
+        return
+    click.echo(tabulate(rows, headers=["Date", "Queue", "Name", "Rank", "Gods"]))
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,193 @@
+import csv
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List
+from .matches import MatchHistory, backfill_opponents
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+history_fields = ["id", "date", "game_mode", "result", "opponent1", "opponent2", "opponent3"]
+leaderboard_fields = ["queue", "rank", "name", "god_1", "god_2", "god_3"]
+formats = (".csv", ".parquet", ".arrow", ".feather")
+
+Batch = List[Dict]
+
+
+def iter_history(history: MatchHistory, batch_size=1000) -> Iterator[Batch]:
+    """Stream the whole match history, oldest first, batch_size rows at a time"""
+    history.flush()
+    cursor = history.conn.execute(
+        "SELECT id, date, game_mode, result, opponent1, opponent2, opponent3 FROM match_results ORDER BY id"
+    )
+    while True:
+        records = cursor.fetchmany(batch_size)
+        if len(records) == 0:
+            return
+        batch = []
+        for record in records:
+            row = dict(zip(history_fields, record))
+            row["game_mode"] = history.game_modes_reverse.get(row["game_mode"], row["game_mode"])
+            batch.append(row)
+        yield batch
+
+
+def iter_leaderboard(leaderboard, batch_size=1000) -> Iterator[Batch]:
+    """Stream the current leaderboard snapshot, one row per player and queue"""
+    batch = []
+    for queue, entries in leaderboard.leaders.items():
+        for entry in entries:
+            gods = list(entry.gods) + [None] * (3 - len(entry.gods))
+            batch.append(dict(zip(leaderboard_fields, [queue, entry.rank, entry.name, *gods])))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if len(batch) > 0:
+        yield batch
+
+
+def _arrow_schema(fields: List[str]):
+    types = {"id": pa.int64(), "rank": pa.int32(), "result": pa.int8()}
+    return pa.schema([(field, types.get(field, pa.string())) for field in fields])
+
+
+def check_format(path) -> str:
+    """The file extension of path, raising ValueError unless it's a supported format"""
+    suffix = Path(path).suffix
+    if suffix not in formats:
+        raise ValueError(
+            f"Unsupported file type '{suffix}' for {path}, expected one of {', '.join(formats)}"
+        )
+    return suffix
+
+
+def write_csv(batches: Iterable[Batch], path, fields: List[str]) -> int:
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for batch in batches:
+            writer.writerows(batch)
+            count += len(batch)
+    return count
+
+
+def write_columnar(batches: Iterable[Batch], path, fields: List[str]) -> int:
+    """Write batches to Parquet, or Arrow IPC for .arrow/.feather paths, one record batch at a time"""
+    if pa is None:
+        raise RuntimeError("pyarrow is required for Parquet and Arrow exports")
+    schema = _arrow_schema(fields)
+    count = 0
+    if Path(path).suffix == ".parquet":
+        writer = pq.ParquetWriter(path, schema)
+    else:
+        writer = pa.ipc.new_file(path, schema)
+    try:
+        for batch in batches:
+            writer.write(pa.RecordBatch.from_pylist(batch, schema=schema))
+            count += len(batch)
+    finally:
+        writer.close()
+    return count
+
+
+def export_rows(batches: Iterable[Batch], path, fields: List[str]) -> int:
+    """Export to CSV, Parquet or Arrow depending on the file extension"""
+    if check_format(path) == ".csv":
+        return write_csv(batches, path, fields)
+    return write_columnar(batches, path, fields)
+
+
+def read_rows(path, batch_size=1000) -> Iterator[Batch]:
+    """Stream rows back from a CSV, Parquet or Arrow export"""
+    suffix = check_format(path)
+    if suffix == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            batch = []
+            for row in csv.DictReader(f):
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if len(batch) > 0:
+                yield batch
+        return
+    if pa is None:
+        raise RuntimeError("pyarrow is required for Parquet and Arrow imports")
+    if suffix == ".parquet":
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield record_batch.to_pylist()
+    else:
+        with pa.memory_map(str(path)) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i).to_pylist()
+
+
+def parse_history_row(history: MatchHistory, row: Dict, number: int) -> tuple:
+    """One exported row as (date, game_mode, result, opponent1, opponent2, opponent3)"""
+    date = row.get("date")
+    if not date:
+        # Without a date there is nothing to tell a re-import from a new match
+        raise ValueError(f"Row {number} has no date")
+    game_mode = row.get("game_mode")
+    if game_mode in history.game_modes:
+        game_mode = history.game_modes[game_mode]
+    else:
+        try:
+            game_mode = int(game_mode)
+        except (TypeError, ValueError):
+            game_mode = None
+        if game_mode not in history.game_modes_reverse:
+            raise ValueError(
+                f"Row {number} has unknown game mode {row.get('game_mode')!r}, expected one of {', '.join(history.game_modes)}"
+            )
+    result = str(row.get("result"))
+    if result not in ("0", "1"):
+        raise ValueError(f"Row {number} has result {row.get('result')!r}, expected 0 or 1")
+    return (
+        date,
+        game_mode,
+        int(result),
+        row.get("opponent1") or None,
+        row.get("opponent2") or None,
+        row.get("opponent3") or None,
+    )
+
+
+def import_history(history: MatchHistory, batches: Iterable[Batch]) -> int:
+    """Append exported match rows to the history in a single transaction, returning how many were new
+
+    Rows get new ids, so histories from several machines can be merged. Rows already in
+    the history, with the same date, game mode, result and opponents, are skipped, so
+    importing the same file twice changes nothing. New rows are inserted in date order,
+    and stats and opponent links are updated the same way as for add_result.
+
+    Raises ValueError, before anything is written, if a row has no date, an unknown
+    game mode or a result that isn't 0 or 1.
+    """
+    history.flush()
+    rows = []
+    for batch in batches:
+        for row in batch:
+            rows.append(parse_history_row(history, row, len(rows) + 1))
+    rows.sort(key=lambda row: row[0])
+    conn = history.conn
+    with conn:
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM match_results").fetchone()[0]
+        count = conn.executemany(
+            """INSERT INTO match_results (date, game_mode, result, opponent1, opponent2, opponent3)
+               SELECT ?1, ?2, ?3, ?4, ?5, ?6
+               WHERE NOT EXISTS (
+                   SELECT 1 FROM match_results
+                   WHERE date = ?1 AND game_mode = ?2 AND result = ?3
+                       AND opponent1 IS ?4 AND opponent2 IS ?5 AND opponent3 IS ?6
+               )""",
+            rows,
+        ).rowcount
+        backfill_opponents(conn, last_id)
+    return count
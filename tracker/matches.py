@@ -1,6 +1,9 @@
+import queue
 import sqlite3
-from typing import List, Dict
-from tabulate import tabulate
+import threading
+from typing import List, Dict, TypedDict
+from perf.timing import timed
+from dko_api.names import normalize_name
 
 
 class MatchEntry(Dict):
@@ -12,9 +15,276 @@ class MatchEntry(Dict):
     result: int
 
 
+class ModeStats(TypedDict):
+    wins: int
+    losses: int
+    streak: int
+    best_streak: int
+    worst_streak: int
+    recent_count: int
+    recent_win_rate: float
+
+
+class OpponentStats(TypedDict):
+    opponent: str
+    wins: int
+    losses: int
+    streak: int
+    recent_count: int
+    recent_win_rate: float
+    last_played: str
+
+
+class HeadToHead(TypedDict):
+    opponent: str
+    wins: int
+    losses: int
+    last_played: str
+
+
+# How many of the latest results per game mode the recent win rate covers. Changing it
+# needs a migration that recreates the mode_stats trigger and rebuilds the table.
+recent_window = 20
+
+# Schema changes, applied in order to bring any match_history.db up to date.
+# PRAGMA user_version records how many have been applied.
+migrations = [
+    [
+        """CREATE TABLE IF NOT EXISTS match_results (
+                  id INTEGER PRIMARY KEY,
+                  date TEXT DEFAULT CURRENT_TIMESTAMP,
+                  opponent1 TEXT,
+                  opponent2 TEXT,
+                  opponent3 TEXT,
+                  game_mode INTEGER,
+                  result INTEGER
+              )""",
+    ],
+    [
+        "CREATE INDEX IF NOT EXISTS idx_match_results_mode_id ON match_results (game_mode, id)",
+        "CREATE INDEX IF NOT EXISTS idx_match_results_mode_result ON match_results (game_mode, result)",
+    ],
+    [
+        # Running totals kept up to date by a trigger, so stats never scan the history.
+        # streak is positive for consecutive wins and negative for consecutive losses.
+        # recent holds the last recent_window results as bits, newest in the lowest bit.
+        """CREATE TABLE mode_stats (
+                  game_mode INTEGER PRIMARY KEY,
+                  wins INTEGER NOT NULL DEFAULT 0,
+                  losses INTEGER NOT NULL DEFAULT 0,
+                  streak INTEGER NOT NULL DEFAULT 0,
+                  best_streak INTEGER NOT NULL DEFAULT 0,
+                  worst_streak INTEGER NOT NULL DEFAULT 0,
+                  recent INTEGER NOT NULL DEFAULT 0,
+                  recent_count INTEGER NOT NULL DEFAULT 0
+              )""",
+        f"""CREATE TRIGGER match_results_stats AFTER INSERT ON match_results
+           BEGIN
+               INSERT INTO mode_stats (game_mode) VALUES (NEW.game_mode)
+                   ON CONFLICT (game_mode) DO NOTHING;
+               UPDATE mode_stats SET
+                   wins = wins + (NEW.result = 1),
+                   losses = losses + (NEW.result = 0),
+                   streak = CASE
+                       WHEN NEW.result = 1 THEN MAX(streak, 0) + 1
+                       ELSE MIN(streak, 0) - 1
+                   END,
+                   recent = ((recent << 1) | (NEW.result = 1)) & {(1 << recent_window) - 1},
+                   recent_count = MIN(recent_count + 1, {recent_window})
+               WHERE game_mode = NEW.game_mode;
+               UPDATE mode_stats SET
+                   best_streak = MAX(best_streak, streak),
+                   worst_streak = MIN(worst_streak, streak)
+               WHERE game_mode = NEW.game_mode;
+           END""",
+        # Backfill the same totals from the existing history. Runs of equal results are
+        # numbered by the difference of two row numbers; the newest run is the streak.
+        f"""INSERT INTO mode_stats (game_mode, wins, losses, streak, best_streak, worst_streak, recent, recent_count)
+           WITH ordered AS (
+               SELECT game_mode, result, result = 1 AS won,
+                   ROW_NUMBER() OVER (PARTITION BY game_mode ORDER BY id DESC) - 1 AS age,
+                   ROW_NUMBER() OVER (PARTITION BY game_mode ORDER BY id)
+                       - ROW_NUMBER() OVER (PARTITION BY game_mode, result = 1 ORDER BY id) AS run
+               FROM match_results
+           ),
+           runs AS (
+               SELECT game_mode, CASE WHEN won THEN COUNT(*) ELSE -COUNT(*) END AS streak, MIN(age) AS age
+               FROM ordered GROUP BY game_mode, won, run
+           ),
+           totals AS (
+               SELECT game_mode, SUM(won) AS wins, SUM(result = 0) AS losses,
+                   SUM(CASE WHEN age < {recent_window} THEN won << age ELSE 0 END) AS recent,
+                   MIN(COUNT(*), {recent_window}) AS recent_count
+               FROM ordered GROUP BY game_mode
+           )
+           SELECT t.game_mode, t.wins, t.losses,
+               (SELECT streak FROM runs r WHERE r.game_mode = t.game_mode AND r.age = 0),
+               (SELECT MAX(MAX(streak), 0) FROM runs r WHERE r.game_mode = t.game_mode),
+               (SELECT MIN(MIN(streak), 0) FROM runs r WHERE r.game_mode = t.game_mode),
+               t.recent, t.recent_count
+           FROM totals t""",
+    ],
+    [
+        # One row per distinct opponent, keyed on the OCR-normalized name so misreads
+        # of the same player share a head-to-head record
+        """CREATE TABLE opponents (
+                  id INTEGER PRIMARY KEY,
+                  key TEXT NOT NULL UNIQUE,
+                  name TEXT NOT NULL
+              )""",
+        """CREATE TABLE match_opponents (
+                  opponent_id INTEGER NOT NULL REFERENCES opponents (id),
+                  match_id INTEGER NOT NULL REFERENCES match_results (id),
+                  PRIMARY KEY (opponent_id, match_id)
+              ) WITHOUT ROWID""",
+        lambda conn: backfill_opponents(conn),
+        # Head-to-head totals per opponent and game mode, kept up to date as matches are
+        # linked. streak and recent work the same way as in mode_stats.
+        """CREATE TABLE opponent_stats (
+                  opponent_id INTEGER NOT NULL REFERENCES opponents (id),
+                  game_mode INTEGER NOT NULL,
+                  wins INTEGER NOT NULL DEFAULT 0,
+                  losses INTEGER NOT NULL DEFAULT 0,
+                  streak INTEGER NOT NULL DEFAULT 0,
+                  recent INTEGER NOT NULL DEFAULT 0,
+                  recent_count INTEGER NOT NULL DEFAULT 0,
+                  last_played TEXT,
+                  PRIMARY KEY (opponent_id, game_mode)
+              ) WITHOUT ROWID""",
+        f"""INSERT INTO opponent_stats (opponent_id, game_mode, wins, losses, streak, recent, recent_count, last_played)
+           WITH ordered AS (
+               SELECT mo.opponent_id, m.game_mode, m.result, m.result = 1 AS won, m.date,
+                   ROW_NUMBER() OVER (PARTITION BY mo.opponent_id, m.game_mode ORDER BY m.id DESC) - 1 AS age,
+                   ROW_NUMBER() OVER (PARTITION BY mo.opponent_id, m.game_mode ORDER BY m.id)
+                       - ROW_NUMBER() OVER (PARTITION BY mo.opponent_id, m.game_mode, m.result = 1 ORDER BY m.id) AS run
+               FROM match_opponents mo
+               JOIN match_results m ON m.id = mo.match_id
+           ),
+           runs AS (
+               SELECT opponent_id, game_mode, CASE WHEN won THEN COUNT(*) ELSE -COUNT(*) END AS streak, MIN(age) AS age
+               FROM ordered GROUP BY opponent_id, game_mode, won, run
+           ),
+           totals AS (
+               SELECT opponent_id, game_mode, SUM(won) AS wins, SUM(result = 0) AS losses,
+                   SUM(CASE WHEN age < {recent_window} THEN won << age ELSE 0 END) AS recent,
+                   MIN(COUNT(*), {recent_window}) AS recent_count, MAX(date) AS last_played
+               FROM ordered GROUP BY opponent_id, game_mode
+           )
+           SELECT t.opponent_id, t.game_mode, t.wins, t.losses, r.streak, t.recent, t.recent_count, t.last_played
+           FROM totals t
+           JOIN runs r ON r.opponent_id = t.opponent_id AND r.game_mode = t.game_mode AND r.age = 0""",
+        f"""CREATE TRIGGER match_opponents_stats AFTER INSERT ON match_opponents
+           BEGIN
+               INSERT INTO opponent_stats (opponent_id, game_mode, wins, losses, streak, recent, recent_count, last_played)
+                   SELECT NEW.opponent_id, game_mode, result = 1, result = 0,
+                       CASE WHEN result = 1 THEN 1 ELSE -1 END, result = 1, 1, date
+                   FROM match_results WHERE id = NEW.match_id
+                   ON CONFLICT (opponent_id, game_mode) DO UPDATE SET
+                       wins = wins + excluded.wins,
+                       losses = losses + excluded.losses,
+                       streak = CASE
+                           WHEN excluded.wins = 1 THEN MAX(streak, 0) + 1
+                           ELSE MIN(streak, 0) - 1
+                       END,
+                       recent = ((recent << 1) | excluded.recent) & {(1 << recent_window) - 1},
+                       recent_count = MIN(recent_count + 1, {recent_window}),
+                       last_played = MAX(last_played, excluded.last_played);
+           END""",
+    ],
+    [
+        # Lets imports skip matches that are already in the history
+        "CREATE INDEX idx_match_results_date ON match_results (date)",
+    ],
+]
+
+insert_result = "INSERT INTO match_results (opponent1, opponent2, opponent3, game_mode, result) VALUES (?, ?, ?, ?, ?)"
+
+
+def link_opponents(conn: sqlite3.Connection, match_id: int, names):
+    for name in names:
+        if not name:
+            continue
+        key = normalize_name(name)
+        conn.execute(
+            "INSERT INTO opponents (key, name) VALUES (?, ?) ON CONFLICT (key) DO NOTHING",
+            (key, name),
+        )
+        opponent_id = conn.execute(
+            "SELECT id FROM opponents WHERE key = ?", (key,)
+        ).fetchone()[0]
+        conn.execute(
+            "INSERT OR IGNORE INTO match_opponents (opponent_id, match_id) VALUES (?, ?)",
+            (opponent_id, match_id),
+        )
+
+
+def insert_results(conn: sqlite3.Connection, rows):
+    """Insert match results and their opponent links, leaving the commit to the caller"""
+    for values in rows:
+        match_id = conn.execute(insert_result, values).lastrowid
+        link_opponents(conn, match_id, values[:3])
+
+
+def backfill_opponents(conn: sqlite3.Connection, after_id: int = 0, batch_size=1000):
+    """Link the opponents of every match with an id above after_id, a batch at a time"""
+    records = conn.execute(
+        "SELECT id, opponent1, opponent2, opponent3 FROM match_results WHERE id > ? ORDER BY id",
+        (after_id,),
+    )
+    while True:
+        batch = records.fetchmany(batch_size)
+        if len(batch) == 0:
+            break
+        names = {}
+        links = []
+        for record in batch:
+            for name in record[1:]:
+                if name:
+                    key = normalize_name(name)
+                    names.setdefault(key, name)
+                    links.append((record[0], key))
+        conn.executemany(
+            "INSERT INTO opponents (key, name) VALUES (?, ?) ON CONFLICT (key) DO NOTHING",
+            names.items(),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO match_opponents (opponent_id, match_id) SELECT id, ? FROM opponents WHERE key = ?",
+            links,
+        )
+
+
+def migrate(conn: sqlite3.Connection, steps: List | None = None):
+    if steps is None:
+        steps = migrations
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, statements in enumerate(steps[version:], start=version + 1):
+        # Explicit BEGIN so DDL is part of the transaction and a failed migration rolls back
+        conn.execute("BEGIN")
+        try:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {number}")
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        conn.commit()
+
+
+def connect(db_file, check_same_thread=True) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_file, check_same_thread=check_same_thread)
+    conn.execute("PRAGMA journal_mode = WAL")
+    # Safe with WAL, a crash can only lose the last commits, never corrupt the db
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
 class MatchHistory:
-    def __init__(self, db_file):
-        self.conn = sqlite3.connect(db_file)
+    def __init__(self, db_file, async_writes=False):
+        self.db_file = db_file
+        self.conn = connect(db_file)
         self.cursor = self.conn.cursor()
         self.game_modes = {
             "1v1 duel": 1,
@@ -22,30 +292,64 @@ class MatchHistory:
             "3v3 arcade": 3,
         }
         self.game_modes_reverse = {v: k for k, v in self.game_modes.items()}
-        self.cursor.execute(
-            """CREATE TABLE IF NOT EXISTS match_results (
-                      id INTEGER PRIMARY KEY,
-                      date TEXT DEFAULT CURRENT_TIMESTAMP,
-                      opponent1 TEXT,
-                      opponent2 TEXT,
-                      opponent3 TEXT,
-                      game_mode INTEGER,
-                      result INTEGER
-                  )"""
-        )
-        self.conn.commit()
+        migrate(self.conn)
+        self.writes = None
+        self.writer = None
+        # An in-memory db can't be shared with a writer connection
+        if async_writes and db_file != ":memory:":
+            self.writes = queue.Queue()
+            self.writer = threading.Thread(
+                target=self._write_loop, name="match-history-writer", daemon=True
+            )
+            self.writer.start()
+
+    def _write_loop(self):
+        conn = connect(self.db_file)
+        while True:
+            batch = [self.writes.get()]
+            # Drain whatever else queued up so it lands in the same transaction
+            while not self.writes.empty():
+                batch.append(self.writes.get_nowait())
+            rows = [values for values in batch if values is not None]
+            try:
+                if len(rows) > 0:
+                    with conn:
+                        insert_results(conn, rows)
+            except sqlite3.Error as err:
+                print(f"Failed to save {len(rows)} match results: {err}")
+            finally:
+                for _ in batch:
+                    self.writes.task_done()
+            if None in batch:
+                conn.close()
+                return
+
+    def flush(self):
+        """Wait for queued writes to be committed"""
+        if self.writes is not None:
+            self.writes.join()
+
+    def close(self):
+        if self.writer is not None:
+            self.writes.put(None)
+            self.writer.join()
+            self.writer = None
+            self.writes = None
+        self.conn.close()
 
     def add_result(self, game_mode, result, opponent1, opponent2=None, opponent3=None):
         values = (opponent1, opponent2, opponent3, self.game_modes[game_mode], result)
-        self.cursor.execute(
-            "INSERT INTO match_results (opponent1, opponent2, opponent3, game_mode, result) VALUES (?, ?, ?, ?, ?)",
-            values,
-        )
-        self.conn.commit()
+        with timed("db_write"):
+            if self.writes is not None:
+                self.writes.put(values)
+                return
+            with self.conn:
+                insert_results(self.conn, [values])
 
     def get_results(self, game_mode, count=10) -> List[MatchEntry]:
+        self.flush()
         self.cursor.execute(
-            "SELECT * FROM match_results WHERE game_mode = ? ORDER BY id DESC LIMIT ?",
+            "SELECT id, date, opponent1, opponent2, opponent3, game_mode, result FROM match_results WHERE game_mode = ? ORDER BY id DESC LIMIT ?",
             (self.game_modes[game_mode], count),
         )
         results = []
@@ -63,21 +367,86 @@ class MatchHistory:
         return results
 
     def get_win_loss(self, game_mode):
-        base_query = f"""
-        SELECT count(*) 
-        FROM match_results 
-        WHERE game_mode = ? 
-            AND result = ?
+        stats = self.get_stats(game_mode)
+        return {"wins": stats["wins"], "losses": stats["losses"]}
+
+    def get_stats(self, game_mode) -> ModeStats:
+        """Win/loss, streaks and recent win rate for a game mode, read from the running totals"""
+        self.flush()
+        self.cursor.execute(
+            "SELECT wins, losses, streak, best_streak, worst_streak, recent, recent_count FROM mode_stats WHERE game_mode = ?",
+            (self.game_modes[game_mode],),
+        )
+        row = self.cursor.fetchone() or (0, 0, 0, 0, 0, 0, 0)
+        wins, losses, streak, best_streak, worst_streak, recent, recent_count = row
+        return ModeStats(
+            wins=wins,
+            losses=losses,
+            streak=streak,
+            best_streak=best_streak,
+            worst_streak=worst_streak,
+            recent_count=recent_count,
+            recent_win_rate=recent.bit_count() / recent_count if recent_count else 0.0,
+        )
+
+    def get_opponent_stats(self, game_mode, opponent: str) -> OpponentStats | None:
+        """Your record, streak and recent win rate against one opponent in a game mode"""
+        self.flush()
+        self.cursor.execute(
+            """SELECT s.wins, s.losses, s.streak, s.recent, s.recent_count, s.last_played
+               FROM opponents o
+               JOIN opponent_stats s ON s.opponent_id = o.id
+               WHERE o.key = ? AND s.game_mode = ?""",
+            (normalize_name(opponent), self.game_modes[game_mode]),
+        )
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        wins, losses, streak, recent, recent_count, last_played = row
+        return OpponentStats(
+            opponent=opponent,
+            wins=wins,
+            losses=losses,
+            streak=streak,
+            recent_count=recent_count,
+            recent_win_rate=recent.bit_count() / recent_count if recent_count else 0.0,
+            last_played=last_played,
+        )
+
+    def head_to_head(
+        self, opponents: List[str], game_mode=None
+    ) -> Dict[str, HeadToHead]:
+        """Your record against each opponent, matched on the normalized name
+
+        Only opponents you have played before are included. Each lookup reads the
+        opponent's running totals, one row per game mode, however long the history is.
         """
-        self.cursor.execute(base_query, (self.game_modes[game_mode], 1))
-        wins = self.cursor.fetchall()[0]
-        self.cursor.execute(base_query, (self.game_modes[game_mode], 0))
-        losses = self.cursor.fetchall()[0]
-        return {"wins": wins[0], "losses": losses[0]}
+        self.flush()
+        query = """
+            SELECT SUM(s.wins), SUM(s.losses), MAX(s.last_played)
+            FROM opponents o
+            JOIN opponent_stats s ON s.opponent_id = o.id
+            WHERE o.key = ?
+        """
+        params = []
+        if game_mode is not None:
+            query += " AND s.game_mode = ?"
+            params.append(self.game_modes[game_mode])
+        records = {}
+        for opponent in opponents:
+            self.cursor.execute(query, (normalize_name(opponent), *params))
+            wins, losses, last_played = self.cursor.fetchone()
+            if last_played is not None:
+                records[opponent] = HeadToHead(
+                    opponent=opponent, wins=wins, losses=losses, last_played=last_played
+                )
+        return records
 
     def history_to_table(self, entries: List[MatchEntry]):
         if len(entries) == 0:
             return "No matches found"
+        from tabulate import tabulate
+
         return tabulate(
             entries,
             headers="keys",
@@ -0,0 +1,177 @@
+import threading
+from typing import Dict, List, NamedTuple, Tuple
+from dko_api.board import QueueBoard
+from dko_api.names import normalize_name
+from .matches import connect, migrate
+
+
+class RankChange(NamedTuple):
+    snapshot_id: int
+    fetched_at: float
+    queue: str
+    name: str
+    # None once the player dropped off the leaderboard
+    rank: int | None
+    gods: List[str]
+
+
+# Each snapshot only stores the entries that differ from the snapshot before it, so a
+# player's rows in rank_changes are exactly the points where their rank or gods moved.
+migrations = [
+    [
+        """CREATE TABLE snapshots (
+                  id INTEGER PRIMARY KEY,
+                  fetched_at REAL NOT NULL,
+                  changes INTEGER NOT NULL
+              )""",
+        """CREATE TABLE rank_changes (
+                  snapshot_id INTEGER NOT NULL REFERENCES snapshots (id),
+                  queue TEXT NOT NULL,
+                  name TEXT NOT NULL,
+                  key TEXT NOT NULL,
+                  rank INTEGER,
+                  gods TEXT,
+                  PRIMARY KEY (queue, name, snapshot_id)
+              ) WITHOUT ROWID""",
+        "CREATE INDEX idx_rank_changes_key ON rank_changes (key, snapshot_id)",
+    ],
+]
+
+State = Dict[Tuple[str, str], Tuple[int, str]]
+
+
+def encode_gods(gods: List[str]) -> str:
+    return ",".join(gods)
+
+
+def decode_gods(gods: str | None) -> List[str]:
+    return gods.split(",") if gods else []
+
+
+class LeaderboardHistory:
+    """Every leaderboard refresh, delta encoded against the previous one"""
+
+    def __init__(self, db_file="leaderboard_history.db"):
+        # Snapshots are recorded from the leaderboard refresh thread
+        self.conn = connect(db_file, check_same_thread=False)
+        self.lock = threading.Lock()
+        migrate(self.conn, migrations)
+        self.state: State | None = None
+
+    def close(self):
+        self.conn.close()
+
+    def latest_id(self) -> int | None:
+        return self.conn.execute("SELECT MAX(id) FROM snapshots").fetchone()[0]
+
+    def _state_at(self, snapshot_id: int, queue: str | None = None) -> State:
+        # SQLite takes the bare columns from the row holding MAX(snapshot_id)
+        query = """
+            SELECT queue, name, rank, gods, MAX(snapshot_id) FROM rank_changes
+            WHERE snapshot_id <= ?
+        """
+        params = [snapshot_id]
+        if queue is not None:
+            query += " AND queue = ?"
+            params.append(queue)
+        query += " GROUP BY queue, name"
+        return {
+            (record[0], record[1]): (record[2], record[3])
+            for record in self.conn.execute(query, params)
+            if record[2] is not None
+        }
+
+    def record(self, leaders: Dict[str, QueueBoard], fetched_at: float) -> int | None:
+        """Store a snapshot of the changes since the last one, returning its id or None if nothing changed"""
+        state = {
+            (queue, name): (rank, encode_gods(gods))
+            for queue, board in leaders.items()
+            for name, rank, gods in zip(board.names, board.ranks, board.gods)
+        }
+        with self.lock:
+            if self.state is None:
+                latest = self.latest_id()
+                self.state = {} if latest is None else self._state_at(latest)
+            changes = [
+                (queue, name, normalize_name(name), rank, gods)
+                for (queue, name), (rank, gods) in state.items()
+                if self.state.get((queue, name)) != (rank, gods)
+            ]
+            changes.extend(
+                (queue, name, normalize_name(name), None, None)
+                for queue, name in self.state.keys() - state.keys()
+            )
+            if len(changes) == 0:
+                return None
+            with self.conn:
+                snapshot_id = self.conn.execute(
+                    "INSERT INTO snapshots (fetched_at, changes) VALUES (?, ?)",
+                    (fetched_at, len(changes)),
+                ).lastrowid
+                self.conn.executemany(
+                    "INSERT INTO rank_changes (snapshot_id, queue, name, key, rank, gods) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(snapshot_id, *change) for change in changes],
+                )
+            self.state = state
+            return snapshot_id
+
+    def rank_history(self, player_name: str, queue: str | None = None) -> List[RankChange]:
+        """Every change to a player's rank or gods, oldest first
+
+        Reads only the player's own rows, a rank holds until the next change.
+        """
+        query = """
+            SELECT c.snapshot_id, s.fetched_at, c.queue, c.name, c.rank, c.gods
+            FROM rank_changes c
+            JOIN snapshots s ON s.id = c.snapshot_id
+            WHERE c.key = ?
+        """
+        params = [normalize_name(player_name)]
+        if queue is not None:
+            query += " AND c.queue = ?"
+            params.append(queue)
+        query += " ORDER BY c.snapshot_id"
+        with self.lock:
+            records = self.conn.execute(query, params).fetchall()
+        return [RankChange(*record[:5], decode_gods(record[5])) for record in records]
+
+    def snapshot(self, snapshot_id: int | None = None) -> Dict[str, List[dict]]:
+        """Rebuild the full leaderboard as of a snapshot, the latest if not given"""
+        with self.lock:
+            if snapshot_id is None:
+                snapshot_id = self.latest_id()
+            state = {} if snapshot_id is None else self._state_at(snapshot_id)
+        leaders = {}
+        for (queue, name), (rank, gods) in state.items():
+            leaders.setdefault(queue, []).append(
+                {"name": name, "rank": rank, "gods": decode_gods(gods)}
+            )
+        for entries in leaders.values():
+            entries.sort(key=lambda entry: entry["rank"])
+        return leaders
+
+    def snapshot_before(self, fetched_at: float) -> int | None:
+        with self.lock:
+            return self.conn.execute(
+                "SELECT MAX(id) FROM snapshots WHERE fetched_at <= ?", (fetched_at,)
+            ).fetchone()[0]
+
+    def movers(self, queue: str, since: float, limit: int = 10) -> List[Tuple[str, int | None, int]]:
+        """Players who climbed the most since the given time, as (name, old rank, new rank)"""
+        before = self.snapshot_before(since)
+        with self.lock:
+            latest = self.latest_id()
+            if latest is None:
+                return []
+            old = {} if before is None else self._state_at(before, queue)
+            new = self._state_at(latest, queue)
+        moves = []
+        for (_, name), (rank, _) in new.items():
+            previous = old.get((queue, name))
+            old_rank = previous[0] if previous is not None else None
+            if old_rank is None or rank < old_rank:
+                moves.append((name, old_rank, rank))
+        # New entries count as climbing from just below the bottom of the board
+        bottom = max((rank for rank, _ in old.values()), default=0) + 1
+        moves.sort(key=lambda move: (move[1] or bottom) - move[2], reverse=True)
+        return moves[:limit]